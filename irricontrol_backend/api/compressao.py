@@ -0,0 +1,23 @@
+from starlette.middleware.gzip import GZipMiddleware
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+
+# Rotas que servem arquivos já comprimidos (overlays PNG, KMZ = zip): gzip só gastaria CPU
+ROTAS_SEM_GZIP = ("/static/", "/kmz/exportar_kmz")
+
+
+class GZipRespostasDeDados:
+    """
+    GZip para as respostas de dados da API (JSON dos KMZs processados, simulações,
+    coberturas), deixando de fora as rotas de ROTAS_SEM_GZIP.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 1000, compresslevel: int = 6):
+        self.app = app
+        self.gzip = GZipMiddleware(app, minimum_size=minimum_size, compresslevel=compresslevel)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "http" and scope["path"].startswith(ROTAS_SEM_GZIP):
+            await self.app(scope, receive, send)
+        else:
+            await self.gzip(scope, receive, send)
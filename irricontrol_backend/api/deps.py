@@ -1,6 +1,20 @@
-import httpx
+from typing import Optional
+from fastapi import Header, HTTPException, Query, Request
+
 from core.config import HTTP_TIMEOUT  # ✔️ Import corrigido
+from api.perfilamento import cliente, verificar_credencial
+from services.estudo_store import EstudoStore, obter_store
 
 async def get_http_session():
+    import httpx  # Import tardio: só quem usa a sessão paga o custo no cold start
+
     async with httpx.AsyncClient(timeout=httpx.Timeout(HTTP_TIMEOUT)) as client:
         yield client
+
+def get_estudo_store() -> EstudoStore:
+    return obter_store()
+
+def verificar_token_perfil(request: Request, x_perfil: Optional[str] = Header(None), perfil: Optional[str] = Query(None)) -> None:
+    erro = verificar_credencial(x_perfil or perfil, cliente(request.scope))
+    if erro is not None:
+        raise HTTPException(status_code=erro[0], detail=erro[1])
@@ -0,0 +1,221 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import os
+import re
+import sys
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+from typing import Any, Deque, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl
+
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from core.config import PERFIL_TOKEN, PERFIL_LIMITE_JANELA, PERFIL_JANELA_S, PERFIL_INTERVALO_S, PERFIL_LIMITE_FALHAS
+from core.paths import BASE_DIR, PERFIS_DIR
+from services.perfilador import AmostradorPilhas
+
+
+PREFIXOS_PERFILADOS = ("/simulation", "/kmz")
+# Corpos JSON até esse tamanho vão inteiros para o relatório; acima disso, só tamanho e hash
+LIMITE_CORPO_JSON = 64 * 1024
+
+# Instantes dos perfis feitos e, por cliente, dos tokens inválidos recebidos dentro da janela de limite
+_perfis_recentes: Deque[float] = deque()
+_falhas_por_cliente: Dict[str, Deque[float]] = {}
+_perfil_em_andamento = False
+# Requisições HTTP em andamento (id -> "MÉTODO caminho") e as que cruzaram o perfil atual
+_em_andamento: Dict[int, str] = {}
+_concorrentes_do_perfil: List[str] = []
+
+
+def token_valido(credencial: Optional[str]) -> bool:
+    return bool(PERFIL_TOKEN) and credencial is not None and hmac.compare_digest(credencial.encode(), PERFIL_TOKEN.encode())
+
+
+def _credencial(scope: Scope) -> Optional[str]:
+    for nome, valor in scope["headers"]:
+        if nome == b"x-perfil":
+            return valor.decode("latin-1")
+    for nome, valor in parse_qsl(scope["query_string"].decode("latin-1")):
+        if nome == "perfil":
+            return valor
+    return None
+
+
+def _na_janela(instantes: Deque[float]) -> int:
+    limite_janela = time.monotonic() - PERFIL_JANELA_S
+    while instantes and instantes[0] < limite_janela:
+        instantes.popleft()
+    return len(instantes)
+
+
+def _vaga_disponivel() -> bool:
+    # Um perfil por vez (o amostrador vê o processo inteiro) e no máximo PERFIL_LIMITE_JANELA por janela
+    return not _perfil_em_andamento and _na_janela(_perfis_recentes) < PERFIL_LIMITE_JANELA
+
+
+def cliente(scope: Scope) -> str:
+    return scope["client"][0] if scope.get("client") else ""
+
+
+def verificar_credencial(credencial: Optional[str], cliente: str) -> Optional[Tuple[int, str]]:
+    """
+    Confere o token de perfil; o middleware e /perfis passam por aqui e dividem a
+    contagem. None se válido, senão (status, detalhe) da resposta de erro.
+
+    Cada cliente tem PERFIL_LIMITE_FALHAS tentativas erradas por janela; depois
+    recebe 429 até a janela passar, mesmo com o token certo, para a força bruta
+    não continuar testando. Os demais clientes (o operador) seguem normalmente.
+    """
+    falhas = _falhas_por_cliente.get(cliente)
+    if falhas is not None and _na_janela(falhas) >= PERFIL_LIMITE_FALHAS:
+        return 429, "Muitas tentativas de perfil. Tente mais tarde."
+    if token_valido(credencial):
+        return None
+
+    for antigo in [c for c, f in _falhas_por_cliente.items() if not _na_janela(f)]:
+        del _falhas_por_cliente[antigo]
+    _falhas_por_cliente.setdefault(cliente, deque()).append(time.monotonic())
+    return 403, "Token de perfil inválido."
+
+
+def _resumir_corpo(content_type: str, inicio: bytes, tamanho: int, sha256: str) -> Dict[str, Any]:
+    corpo: Dict[str, Any] = {"bytes": tamanho, "sha256": sha256}
+    if content_type.startswith("application/json") and tamanho <= LIMITE_CORPO_JSON:
+        try:
+            corpo["json"] = json.loads(inicio)
+        except ValueError:
+            pass
+    elif content_type.startswith("multipart/form-data"):
+        # Nome dos arquivos enviados (o KMZ da fazenda), tirado dos cabeçalhos das partes
+        corpo["arquivos"] = [nome.decode("utf-8", "replace") for nome in re.findall(rb'filename="([^"]*)"', inicio)]
+    return corpo
+
+
+def _salvar_relatorio(caminho: str, relatorio: Dict[str, Any]) -> None:
+    os.makedirs(PERFIS_DIR, exist_ok=True)
+    caminho_tmp = f"{caminho}.tmp"
+    with open(caminho_tmp, "w") as f:
+        json.dump(relatorio, f, ensure_ascii=False)
+    os.replace(caminho_tmp, caminho)
+
+
+class PerfilamentoMiddleware:
+    """
+    🔬 Roda uma requisição de /simulation ou /kmz sob o amostrador de pilhas
+    quando ela traz o token de perfil (header `X-Perfil` ou `?perfil=`).
+
+    O relatório speedscope vai para arquivos/perfis, marcado com as entradas da
+    requisição (método, caminho, query, corpo ou nome/hash do KMZ), e o nome do
+    arquivo volta no header `X-Perfil-Relatorio` (baixe em /perfis/{nome}).
+    As requisições que rodaram junto com a perfilada ficam em
+    `requisicoes_concorrentes`; enquanto houver alguma, o threadpool não é amostrado.
+    Só é instalado quando PERFIL_TOKEN está definido.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        chave = id(scope)
+        _em_andamento[chave] = f"{scope['method']} {scope['path']}"
+        if _perfil_em_andamento:
+            _concorrentes_do_perfil.append(_em_andamento[chave])
+        try:
+            await self._despachar(scope, receive, send)
+        finally:
+            del _em_andamento[chave]
+
+    async def _despachar(self, scope: Scope, receive: Receive, send: Send) -> None:
+        credencial = _credencial(scope) if scope["path"].startswith(PREFIXOS_PERFILADOS) else None
+        if credencial is None:
+            await self.app(scope, receive, send)
+            return
+        erro = verificar_credencial(credencial, cliente(scope))
+        if erro is not None:
+            status_code, detalhe = erro
+            await JSONResponse({"detail": detalhe}, status_code=status_code)(scope, receive, send)
+            return
+        if not _vaga_disponivel():
+            await JSONResponse({"detail": "Limite de perfis atingido. Tente mais tarde."}, status_code=429)(scope, receive, send)
+            return
+
+        await self._perfilar(scope, receive, send)
+
+    async def _perfilar(self, scope: Scope, receive: Receive, send: Send) -> None:
+        global _perfil_em_andamento
+        _perfil_em_andamento = True
+        _perfis_recentes.append(time.monotonic())
+        _concorrentes_do_perfil[:] = [r for chave, r in _em_andamento.items() if chave != id(scope)]
+
+        caminho_req = scope["path"]
+        nome_relatorio = (
+            f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{caminho_req.strip('/').replace('/', '_')}"
+            f"_{uuid.uuid4().hex[:6]}.speedscope.json"
+        )
+        headers = {nome.decode("latin-1"): valor.decode("latin-1") for nome, valor in scope["headers"]}
+        sha256 = hashlib.sha256()
+        inicio_corpo = bytearray()
+        tamanho_corpo = 0
+        status = {"codigo": None}
+
+        async def receive_registrando() -> Message:
+            nonlocal tamanho_corpo
+            mensagem = await receive()
+            if mensagem["type"] == "http.request":
+                corpo = mensagem.get("body", b"")
+                sha256.update(corpo)
+                tamanho_corpo += len(corpo)
+                if len(inicio_corpo) < LIMITE_CORPO_JSON:
+                    inicio_corpo.extend(corpo[:LIMITE_CORPO_JSON - len(inicio_corpo)])
+            return mensagem
+
+        async def send_com_relatorio(mensagem: Message) -> None:
+            if mensagem["type"] == "http.response.start":
+                status["codigo"] = mensagem["status"]
+                mensagem = {
+                    **mensagem,
+                    "headers": [*mensagem.get("headers", []), (b"x-perfil-relatorio", nome_relatorio.encode())],
+                }
+            await send(mensagem)
+
+        print(f"🔬 Perfilando {scope['method']} {caminho_req} -> {nome_relatorio}")
+        amostrador = AmostradorPilhas(
+            PERFIL_INTERVALO_S, BASE_DIR, frame_raiz=sys._getframe(), exclusiva=lambda: len(_em_andamento) == 1
+        )
+        amostrador.iniciar()
+        try:
+            await self.app(scope, receive_registrando, send_com_relatorio)
+        finally:
+            amostrador.parar()
+            try:
+                metadados = {
+                    "metodo": scope["method"],
+                    "caminho": caminho_req,
+                    "query": [[k, v] for k, v in parse_qsl(scope["query_string"].decode("latin-1")) if k != "perfil"],
+                    "content_type": headers.get("content-type", ""),
+                    "corpo": _resumir_corpo(headers.get("content-type", ""), bytes(inicio_corpo), tamanho_corpo, sha256.hexdigest()),
+                    "status": status["codigo"],
+                    "duracao_s": round(amostrador.duracao, 4),
+                    "intervalo_s": PERFIL_INTERVALO_S,
+                    "requisicoes_concorrentes": list(_concorrentes_do_perfil),
+                    "amostras_threadpool_descartadas": amostrador.descartadas,
+                    "criado_em": datetime.now().isoformat(),
+                }
+                relatorio = amostrador.para_speedscope(f"{scope['method']} {caminho_req}", metadados)
+                await asyncio.to_thread(_salvar_relatorio, os.path.join(PERFIS_DIR, nome_relatorio), relatorio)
+                print(f"🔬 Perfil salvo: {nome_relatorio} ({amostrador.duracao:.2f}s)")
+            except Exception as e:
+                print(f"⚠️ Não foi possível salvar o perfil {nome_relatorio}: {e}")
+            finally:
+                _perfil_em_andamento = False
+                _concorrentes_do_perfil.clear()
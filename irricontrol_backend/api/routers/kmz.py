@@ -1,176 +1,160 @@
-from fastapi import APIRouter, UploadFile, File, Query, HTTPException
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, UploadFile, File, Query, HTTPException, Depends
+from fastapi.responses import FileResponse, StreamingResponse, ORJSONResponse
+import asyncio
 import os
-import json
-import simplekml
+import orjson
+import tempfile
 from datetime import datetime
 import zipfile
-from typing import Optional, List
+from typing import Optional, List, Literal
 
 
 from services.kmz_parser import parse_kmz
+from services.kmz_lote import LoteMuitoGrandeError, expandir_arquivos, processar_lote
+from services.kmz_export import gerar_kmz_estudo
+from services.estudo_store import EstudoStore
+from services.geometria import compactar_ciclos
+from services.especulacao import iniciar_especulacao
+from services.sinal_dbm import remover_imagens
+from api.deps import get_estudo_store
 from models.simulation import ProcessKmzResponse # Importa modelos Pydantic
 from core.paths import STATIC_IMAGENS_DIR, ARQUIVOS_DIR  # ✅ CERTO
+from core.config import KMZ_LOTE_MAX_TOTAL_MB, ESTUDOS_TTL_DIAS, ESTUDOS_MAX
 
 
+router = APIRouter()
 
 
-@router.post("/processar_kmz", response_model=ProcessKmzResponse, tags=["KMZ"])
-async def processar_kmz_endpoint(file: UploadFile = File(...)):
-    # ... (resto do seu código do endpoint)
+@router.post("/processar_kmz", response_model=ProcessKmzResponse, response_class=ORJSONResponse, tags=["KMZ"])
+async def processar_kmz_endpoint(
+    file: UploadFile = File(...),
+    tolerancia_m: float = Query(0, ge=0, description="Tolerância (m) para simplificar os círculos; 0 mantém todos os vértices"),
+    formato: Literal["coordenadas", "polyline"] = Query("coordenadas", description="'polyline' devolve cada círculo como Encoded Polyline"),
+    store: EstudoStore = Depends(get_estudo_store),
+):
+    caminho_kmz_entrada = None
     try:
-        print("📥 Recebendo arquivo KMZ...") #
-        conteudo = await file.read() #
-
-        os.makedirs(ARQUIVOS_DIR, exist_ok=True) #
-        caminho_kmz_entrada = os.path.join(ARQUIVOS_DIR, "entrada.kmz") #
+        print("📥 Recebendo arquivo KMZ...")
+        conteudo = await file.read()
 
-        with open(caminho_kmz_entrada, "wb") as f: #
-            f.write(conteudo) #
-        print("📦 KMZ salvo em:", caminho_kmz_entrada) #
+        os.makedirs(ARQUIVOS_DIR, exist_ok=True)
+        # Arquivo temporário próprio: uploads simultâneos não se sobrescrevem
+        with tempfile.NamedTemporaryFile(suffix=".kmz", dir=ARQUIVOS_DIR, delete=False) as f:
+            f.write(conteudo)
+            caminho_kmz_entrada = f.name
 
-        antena, pivos, ciclos, bombas = parse_kmz(caminho_kmz_entrada) #
+        antena, pivos, ciclos, bombas = parse_kmz(caminho_kmz_entrada)
 
-        if not antena: #
+        if not antena:
             raise HTTPException(status_code=400, detail="Antena não encontrada no KMZ")
 
-        return ProcessKmzResponse(antena=antena, pivos=pivos, ciclos=ciclos, bombas=bombas) #
+        # 🗄️ Persiste a fazenda parseada; exportações e simulações leem daqui
+        estudo_id = store.criar_estudo(file.filename, antena, pivos, ciclos, bombas)
+        print(f"🗄️ Estudo {estudo_id} criado para {file.filename}")
+        # 🧹 Retenção: cada upload cria um estudo; os antigos saem do banco e do disco
+        remover_imagens(store.remover_estudos_antigos(ESTUDOS_TTL_DIAS, ESTUDOS_MAX), STATIC_IMAGENS_DIR)
+
+        # 🔮 Opt-in (SIMULACAO_ESPECULATIVA=1): adianta a simulação que o usuário quase sempre pede em seguida
+        iniciar_especulacao(antena)
 
-    except HTTPException as http_exc: #
+        # O estudo guarda a geometria completa; só a resposta é simplificada/compactada
+        ciclos_resposta = compactar_ciclos(ciclos, tolerancia_m, formato)
+        return ProcessKmzResponse(antena=antena, pivos=pivos, ciclos=ciclos_resposta, bombas=bombas, estudo_id=estudo_id)
+
+    except HTTPException as http_exc:
         raise http_exc # Re-levanta HTTPException para ser tratada pelo FastAPI
-    except Exception as e: #
-        print(f"❌ Erro em /processar_kmz: {str(e)}") #
+    except Exception as e:
+        print(f"❌ Erro em /processar_kmz: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erro interno ao processar KMZ: {str(e)}")
+    finally:
+        if caminho_kmz_entrada and os.path.exists(caminho_kmz_entrada):
+            os.remove(caminho_kmz_entrada)
+
+
+@router.post("/processar_kmz_lote", tags=["KMZ"])
+async def processar_kmz_lote_endpoint(
+    files: List[UploadFile] = File(...),
+    tolerancia_m: float = Query(0, ge=0, description="Tolerância (m) para simplificar os círculos"),
+    formato: Literal["coordenadas", "polyline"] = Query("coordenadas"),
+):
+    # 📚 Aceita vários KMZ/KML e/ou um .zip com vários deles; responde em NDJSON,
+    # uma linha por fazenda, à medida que cada parse termina
+    print(f"📥 Recebendo lote com {len(files)} arquivo(s)...")
+    if sum(upload.size or 0 for upload in files) > KMZ_LOTE_MAX_TOTAL_MB * 1024 * 1024:
+        raise HTTPException(status_code=413, detail=f"O lote passa do limite de {KMZ_LOTE_MAX_TOTAL_MB:g} MB.")
+    arquivos = []
+    for indice, upload in enumerate(files):
+        arquivos.append((upload.filename or f"arquivo_{indice}.kmz", await upload.read()))
+
+    # Descompactar pode ser pesado: fora do loop de eventos
+    try:
+        arquivos = await asyncio.to_thread(expandir_arquivos, arquivos)
+    except zipfile.BadZipFile as e:
+        raise HTTPException(status_code=400, detail=f"ZIP do lote inválido: {str(e)}")
+    except LoteMuitoGrandeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+    if not arquivos:
+        raise HTTPException(status_code=400, detail="Nenhum arquivo KMZ/KML encontrado no lote.")
+
+    async def gerar_ndjson():
+        async for resultado in processar_lote(arquivos):
+            if "ciclos" in resultado:
+                resultado["ciclos"] = compactar_ciclos(resultado["ciclos"], tolerancia_m, formato)
+            yield orjson.dumps(resultado) + b"\n"
+
+    # Content-Encoding explícito: o GZip buffera o stream e atrasaria cada linha
+    return StreamingResponse(gerar_ndjson(), media_type="application/x-ndjson", headers={"Content-Encoding": "identity"})
 
 
 @router.get("/exportar_kmz", tags=["KMZ"])
 def exportar_kmz_endpoint(
-    imagem: Optional[str] = Query(None, description="Nome da imagem PNG principal"), #
-    bounds_file: Optional[str] = Query(None, description="Nome do JSON de bounds da imagem principal") #
+    estudo_id: Optional[int] = Query(None, description="ID do estudo (padrão: o mais recente)"),
+    imagem: Optional[str] = Query(None, description="Nome da imagem PNG principal (padrão: a última simulação principal do estudo)"),
+    repetidoras: Optional[List[str]] = Query(None, description="Nomes dos PNGs de repetidoras a incluir (padrão: todas do estudo)"),
+    store: EstudoStore = Depends(get_estudo_store),
 ):
-    # ... (resto do seu código do endpoint)
     try:
-        caminho_kmz_entrada = os.path.join(ARQUIVOS_DIR, "entrada.kmz") #
-        if not os.path.exists(caminho_kmz_entrada): #
-            raise HTTPException(status_code=404, detail="KMZ de entrada não encontrado. Processe um KMZ primeiro.")
+        if estudo_id is None:
+            estudo_id = store.obter_estudo_atual()
+        fazenda = store.obter_fazenda(estudo_id) if estudo_id is not None else None
+        if fazenda is None:
+            raise HTTPException(status_code=404, detail="Estudo não encontrado. Processe um KMZ primeiro.")
 
-        antena, pivos_parsed, ciclos, _ = parse_kmz(caminho_kmz_entrada) #
+        antena, pivos_parsed, ciclos, _ = fazenda
 
-        if not antena or not pivos_parsed: #
+        if not antena or not pivos_parsed:
             raise HTTPException(status_code=400, detail="Antena ou pivôs não encontrados no KMZ original.")
 
-        caminho_imagem_principal_abs = os.path.join(STATIC_IMAGENS_DIR, imagem) if imagem else None #
-        caminho_bounds_principal_abs = os.path.join(STATIC_IMAGENS_DIR, bounds_file) if bounds_file else None #
-
-        bounds_principal = None #
-        if caminho_bounds_principal_abs and os.path.exists(caminho_bounds_principal_abs): #
-            with open(caminho_bounds_principal_abs, "r") as f: #
-                bounds_data = json.load(f) #
-                bounds_principal = bounds_data.get("bounds", bounds_data) #
-        elif imagem and not bounds_file: #
-            possible_bounds_file = imagem.replace(".png", ".json") #
-            caminho_bounds_deduzido = os.path.join(STATIC_IMAGENS_DIR, possible_bounds_file) #
-            if os.path.exists(caminho_bounds_deduzido): #
-                with open(caminho_bounds_deduzido, "r") as f: #
-                    bounds_data = json.load(f) #
-                    bounds_principal = bounds_data.get("bounds", bounds_data) #
-                    print(f"Info: Bounds deduzido para {imagem} como {possible_bounds_file}") #
-            else: #
-                 print(f"Aviso: Bounds não fornecido nem deduzido para {imagem}. Overlay principal pode não ser adicionado.") #
-
-
-        kml = simplekml.Kml(name="Estudo de Cobertura Irricontrol") #
-
-        torre_style = simplekml.Style() #
-        torre_style.iconstyle.icon.href = "http://maps.google.com/mapfiles/kml/paddle/T.png" #
-        torre_style.iconstyle.scale = 1.2 #
-
-        pnt_torre = kml.newpoint(name=antena.get("nome", "Antena Principal"), #
-                                 coords=[(antena["lon"], antena["lat"])]) #
-        pnt_torre.description = f"Altura: {antena['altura']}m" #
-        pnt_torre.style = torre_style #
-
-        for p in pivos_parsed: #
-            pnt_pivo = kml.newpoint(name=p["nome"], coords=[(p["lon"], p["lat"])]) #
-            pnt_pivo.description = "Status de cobertura a ser verificado" #
-            pnt_pivo.style = torre_style # Reutiliza estilo da torre, pode querer um diferente para pivos #
-
-
-        for ciclo in ciclos: #
-            if ciclo.get("coordenadas"): #
-                poly = kml.newpolygon(name=ciclo.get("nome", "Área Pivô")) #
-                poly.outerboundaryis = [(lon, lat) for lat, lon in ciclo["coordenadas"]] #
-                poly.style.polystyle.color = simplekml.Color.changealphaint(100, simplekml.Color.yellow) #
-                poly.style.linestyle.color = simplekml.Color.red #
-                poly.style.linestyle.width = 2 #
-
-        if caminho_imagem_principal_abs and os.path.exists(caminho_imagem_principal_abs) and bounds_principal: #
-            ground = kml.newgroundoverlay(name=f"Cobertura: {antena.get('nome', 'Principal')}") #
-            ground.icon.href = imagem #
-            ground.latlonbox.north, ground.latlonbox.south = bounds_principal[2], bounds_principal[0] #
-            ground.latlonbox.east, ground.latlonbox.west = bounds_principal[3], bounds_principal[1] #
-            ground.color = simplekml.Color.changealphaint(180, simplekml.Color.white) #
-        
-        arquivos_na_pasta_imagens = os.listdir(STATIC_IMAGENS_DIR) #
-        imagens_embebidas_kmz = {imagem} if imagem else set() #
-        caminho_icone_cloudrf_local = os.path.join(STATIC_IMAGENS_DIR, "cloudrf.png") #
-        if os.path.exists(caminho_icone_cloudrf_local): #
-             imagens_embebidas_kmz.add("cloudrf.png") #
-
-
-        for nome_arq_img_rep in arquivos_na_pasta_imagens: #
-            if nome_arq_img_rep.startswith("repetidora_") and nome_arq_img_rep.endswith(".png"): #
-                nome_arq_json_rep = nome_arq_img_rep.replace(".png", ".json") #
-                caminho_json_rep_abs = os.path.join(STATIC_IMAGENS_DIR, nome_arq_json_rep) #
-
-                if os.path.exists(caminho_json_rep_abs): #
-                    with open(caminho_json_rep_abs, "r") as f_rep_bounds: #
-                        bounds_rep_data = json.load(f_rep_bounds) #
-                        bounds_rep = bounds_rep_data.get("bounds", bounds_rep_data) #
-                    
-                    ground_rep = kml.newgroundoverlay(name=f"Cobertura Repetidora: {nome_arq_img_rep}") #
-                    ground_rep.icon.href = nome_arq_img_rep #
-                    ground_rep.latlonbox.north, ground_rep.latlonbox.south = bounds_rep[2], bounds_rep[0] #
-                    ground_rep.latlonbox.east, ground_rep.latlonbox.west = bounds_rep[3], bounds_rep[1] #
-                    ground_rep.color = simplekml.Color.changealphaint(150, simplekml.Color.white) #
-                    imagens_embebidas_kmz.add(nome_arq_img_rep) #
-                    try: #
-                        parts = nome_arq_img_rep.split('_') #
-                        lat_rep_str = parts[-2].replace('m','-').replace('_','.') #
-                        lon_rep_str = parts[-1].replace('.png','').replace('m','-').replace('_','.') #
-                        lat_rep, lon_rep = float(lat_rep_str), float(lon_rep_str) #
-                        pnt_rep = kml.newpoint(name=f"Repetidora ({nome_arq_img_rep.split('_')[1]})", coords=[(lon_rep, lat_rep)]) #
-                        pnt_rep.style = torre_style #
-                    except Exception: # fallback se nome não tem coords #
-                        lat_rep_centro = (bounds_rep[0] + bounds_rep[2]) / 2 #
-                        lon_rep_centro = (bounds_rep[1] + bounds_rep[3]) / 2 #
-                        pnt_rep = kml.newpoint(name=f"Repetidora ({nome_arq_img_rep.split('_')[1]})", coords=[(lon_rep_centro, lat_rep_centro)]) #
-                        pnt_rep.style = torre_style #
-
-
-        os.makedirs(ARQUIVOS_DIR, exist_ok=True) #
-        caminho_kml_saida = os.path.join(ARQUIVOS_DIR, "estudo_irricontrol.kml") #
-        kml.save(caminho_kml_saida) #
-
-        nome_arquivo_kmz = f"EstudoIrricontrol_{datetime.now().strftime('%Y%m%d_%H%M%S')}.kmz" #
-        caminho_kmz_final = os.path.join(ARQUIVOS_DIR, nome_arquivo_kmz) #
-
-        with zipfile.ZipFile(caminho_kmz_final, 'w', zipfile.ZIP_DEFLATED) as kmz_zip: #
-            kmz_zip.write(caminho_kml_saida, os.path.basename(caminho_kml_saida)) #
-            
-            for img_nome_relativo in imagens_embebidas_kmz: #
-                if img_nome_relativo: #
-                    caminho_img_abs = os.path.join(STATIC_IMAGENS_DIR, img_nome_relativo) #
-                    if os.path.exists(caminho_img_abs): #
-                        kmz_zip.write(caminho_img_abs, img_nome_relativo) #
-                    else: #
-                        print(f"Aviso: Imagem {img_nome_relativo} não encontrada para adicionar ao KMZ.") #
-
-
-        return FileResponse(caminho_kmz_final, media_type="application/vnd.google-earth.kmz", filename=nome_arquivo_kmz) #
-
-    except HTTPException as http_exc: #
-        raise http_exc #
-    except Exception as e: #
-        print(f"❌ Erro em /exportar_kmz: {str(e)}") #
-        raise HTTPException(status_code=500, detail=f"Erro interno ao exportar KMZ: {str(e)}")
\ No newline at end of file
+        simulacoes = store.listar_simulacoes(estudo_id)
+        principais = [s for s in simulacoes if s["tipo"] == "principal"]
+        if imagem:
+            principais = [s for s in principais if s["nome_arquivo"] == imagem]
+        principal = principais[-1] if principais else None
+        if principal is None:
+            print(f"Aviso: Nenhuma simulação principal registrada para o estudo {estudo_id}. Overlay principal não será adicionado.")
+
+        repetidoras_kmz = [
+            {"imagem": s["nome_arquivo"], "bounds": s["bounds"], "lat": s["lat"], "lon": s["lon"], "nome": s["template"].lower()}
+            for s in simulacoes
+            if s["tipo"] == "repetidora" and (repetidoras is None or s["nome_arquivo"] in repetidoras)
+        ]
+
+        os.makedirs(ARQUIVOS_DIR, exist_ok=True)
+        nome_arquivo_kmz = f"EstudoIrricontrol_{datetime.now().strftime('%Y%m%d_%H%M%S')}.kmz"
+        caminho_kmz_final = os.path.join(ARQUIVOS_DIR, nome_arquivo_kmz)
+
+        gerar_kmz_estudo(
+            antena, pivos_parsed, ciclos, caminho_kmz_final, STATIC_IMAGENS_DIR,
+            imagem_principal=principal["nome_arquivo"] if principal else None,
+            bounds_principal=principal["bounds"] if principal else None,
+            repetidoras=repetidoras_kmz
+        )
+
+        return FileResponse(caminho_kmz_final, media_type="application/vnd.google-earth.kmz", filename=nome_arquivo_kmz)
+
+    except HTTPException as http_exc:
+        raise http_exc
+    except Exception as e:
+        print(f"❌ Erro em /exportar_kmz: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Erro interno ao exportar KMZ: {str(e)}")
@@ -0,0 +1,30 @@
+import os
+from typing import List
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import FileResponse
+
+from core.paths import PERFIS_DIR
+from api.deps import verificar_token_perfil
+
+SUFIXO_RELATORIO = ".speedscope.json"
+
+router = APIRouter(dependencies=[Depends(verificar_token_perfil)])
+
+
+# 🔬 Relatórios gerados pelo perfilamento sob demanda (mais recentes primeiro)
+@router.get("/", response_model=List[str], tags=["Perfis"])
+def listar_perfis_endpoint():
+    if not os.path.isdir(PERFIS_DIR):
+        return []
+    return sorted((nome for nome in os.listdir(PERFIS_DIR) if nome.endswith(SUFIXO_RELATORIO)), reverse=True)
+
+
+# 📥 Abra o arquivo em https://www.speedscope.app
+@router.get("/{nome}", tags=["Perfis"])
+def baixar_perfil_endpoint(nome: str):
+    if os.path.basename(nome) != nome or not nome.endswith(SUFIXO_RELATORIO):
+        raise HTTPException(status_code=400, detail="Nome de relatório inválido.")
+    caminho = os.path.join(PERFIS_DIR, nome)
+    if not os.path.exists(caminho):
+        raise HTTPException(status_code=404, detail="Relatório não encontrado.")
+    return FileResponse(caminho, media_type="application/json", filename=nome)
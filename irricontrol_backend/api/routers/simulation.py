@@ -1,20 +1,30 @@
 from fastapi import APIRouter, HTTPException, Depends, Request
-import httpx
+from fastapi.responses import ORJSONResponse
 import os
-import json
-from typing import List, Optional
+from typing import TYPE_CHECKING, List, Optional
 from core.paths import STATIC_IMAGENS_DIR
 
 
 # ✅ Corrigido os imports
-from core.config import API_URL as CLOUDRF_API_URL, API_KEY as CLOUDRF_API_KEY, obter_template
+from core.config import obter_template
 from models.simulation import (
     SimularSinalRequest, SimularManualRequest, ReavaliarPivosRequest, PerfilElevacaoRequest,
     SimulationResponse, PerfilElevacaoResponse, ReavaliarPivosResponse, PivoData,
-    OverlayData, BloqueioData
+    OverlayData, BloqueioData, AtualizarCoberturaRequest, AtualizarCoberturaResponse
 )
-from services.image_analysis import detectar_pivos_fora
-from api.deps import get_http_session
+from services.image_analysis import detectar_pivos_fora, reavaliar_cobertura
+from services.cloudrf_service import CloudRFError, corrigir_bounds, montar_payload, simular_cobertura
+from services.sinal_dbm import amostrar_pivos, obter_grade, remover_imagens
+from services.cobertura_incremental import (
+    avaliar_pendentes, codificar_camada, combinar_camadas, decodificar_camada, mapear_pivos,
+    mesma_posicao, nova_camada, pendentes, remapear_camada
+)
+from services.especulacao import reivindicar_especulacao
+from services.estudo_store import EstudoStore
+from api.deps import get_http_session, get_estudo_store
+
+if TYPE_CHECKING:
+    import httpx  # Carregado sob demanda (cold start); aqui só para as anotações
 
 
 router = APIRouter()
@@ -23,38 +33,27 @@ router = APIRouter()
 def format_coord_for_filename(coord: float) -> str:
     return f"{coord:.6f}".replace(".", "_").replace("-", "m")
 
-async def _call_cloudrf_api(payload: dict, client: httpx.AsyncClient):
-    headers = {"key": CLOUDRF_API_KEY, "Content-Type": "application/json"}
-    try:
-        # Aumentado o timeout para chamadas mais longas
-        response = await client.post(CLOUDRF_API_URL, headers=headers, json=payload, timeout=90.0) 
-        response.raise_for_status()
-        return response.json()
-    except httpx.HTTPStatusError as e:
-        print(f"❌ Erro na API CloudRF: {e.response.status_code} - {e.response.text}")
-        raise HTTPException(status_code=e.response.status_code, detail=f"Erro na API CloudRF: {e.response.text}")
-    except httpx.RequestError as e:
-        print(f"❌ Erro de requisição para CloudRF: {str(e)}")
-        raise HTTPException(status_code=503, detail=f"Não foi possível conectar à API CloudRF: {str(e)}")
-    except json.JSONDecodeError as e_json:
-        # Adicionado 'e' para o contexto do erro
-        print(f"❌ Erro ao decodificar JSON da CloudRF. Resposta: {e_json.response.text[:500]}")
-        raise HTTPException(status_code=500, detail="Resposta inválida (não JSON) da API CloudRF.")
-
-async def _download_and_save_image(image_url: str, local_path: str, client: httpx.AsyncClient):
+async def _simular_cloudrf(payload: dict, caminho_imagem: str, client: "httpx.AsyncClient") -> List[float]:
     try:
-        # Aumentado o timeout para downloads
-        r = await client.get(image_url, timeout=90.0)
-        r.raise_for_status()
-        with open(local_path, "wb") as f:
-            f.write(r.content)
-        print(f"✅ Imagem salva em {local_path}")
-    except httpx.HTTPStatusError as e:
-        print(f"❌ Erro ao baixar imagem {image_url}: Status {e.response.status_code} - {e.response.text}")
-        raise HTTPException(status_code=e.response.status_code, detail=f"Falha ao baixar imagem de sinal: {e.response.text}")
-    except httpx.RequestError as e:
-        print(f"❌ Erro de requisição ao baixar imagem {image_url}: {str(e)}")
-        raise HTTPException(status_code=503, detail=f"Não foi possível baixar a imagem: {str(e)}")
+        return await simular_cobertura(payload, caminho_imagem, client)
+    except CloudRFError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+def _adicionar_sinal(pivos_status: List[dict], bounds: List[float], caminho_imagem: str, tpl: dict) -> None:
+    # 📶 Nível de sinal e margem sobre o rxs do template, lidos da grade de dBm (decodificada uma vez)
+    grade = obter_grade(caminho_imagem, tpl["col"])
+    if grade is None:
+        return
+    for p, nivel in zip(pivos_status, amostrar_pivos(bounds, pivos_status, grade)):
+        p["sinal_dbm"] = nivel
+        p["margem_db"] = nivel - tpl["rxs"] if nivel is not None else None
+
+def _resolver_estudo(store: EstudoStore, estudo_id: Optional[int]) -> int:
+    if estudo_id is None:
+        estudo_id = store.obter_estudo_atual()
+    if estudo_id is None or not store.estudo_existe(estudo_id):
+        raise HTTPException(status_code=404, detail="Estudo não encontrado. Processe um KMZ primeiro.")
+    return estudo_id
 
 # Função auxiliar para pegar a URL base (para evitar problemas no OnRender)
 def get_base_url(http_request: Request) -> str:
@@ -64,57 +63,36 @@ def get_base_url(http_request: Request) -> str:
         print(f"Aviso: BACKEND_URL_FOR_FRONTEND não definida. Usando URL construída: {base_url}")
     return base_url
 
-@router.post("/simular_sinal", response_model=SimulationResponse, tags=["Simulation"])
-async def simular_sinal_endpoint(request_data: SimularSinalRequest, http_request: Request, client: httpx.AsyncClient = Depends(get_http_session)):
+@router.post("/simular_sinal", response_model=SimulationResponse, response_class=ORJSONResponse, tags=["Simulation"])
+async def simular_sinal_endpoint(request_data: SimularSinalRequest, http_request: Request, client: "httpx.AsyncClient" = Depends(get_http_session), store: EstudoStore = Depends(get_estudo_store)):
     print(f"📡 Simulação Sinal Principal recebida para: {request_data.nome or 'Antena Padrão'}")
     try:
         tpl = obter_template(request_data.template)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
+    estudo_id = _resolver_estudo(store, request_data.estudo_id)
+
+    # Nova simulação principal reinicia o estudo: descarta as simulações anteriores (principal e repetidoras)
+    remover_imagens(store.remover_simulacoes(estudo_id), STATIC_IMAGENS_DIR)
 
-    # Limpeza de arquivos antigos (código mantido)
-    for f_name in os.listdir(STATIC_IMAGENS_DIR):
-        if f_name.startswith("sinal_") and (f_name.endswith(".png") or f_name.endswith(".json")):
-            try:
-                os.remove(os.path.join(STATIC_IMAGENS_DIR, f_name))
-            except OSError as e_remove:
-                print(f"Aviso: Não foi possível remover arquivo antigo {f_name}: {e_remove}")
-
-    payload = { # (código mantido)
-        "version": "CloudRF-API-v3.24", "site": tpl["site"], "network": "Network", "engine": 2, "coordinates": 1,
-        "transmitter": {"lat": request_data.lat, "lon": request_data.lon, "alt": request_data.altura, "frq": tpl["frq"], "txw": tpl["transmitter"]["txw"], "bwi": tpl["transmitter"]["bwi"], "powerUnit": "W"},
-        "receiver": tpl["receiver"], "feeder": {"flt": 1, "fll": 0, "fcc": 0},
-        "antenna": {**tpl["antenna"], "mode": "template", "txl": 0, "ant": 1, "azi": 0, "tlt": 0, "hbw": 360, "vbw": 90, "pol": "v"},
-        "model": {"pm": 1, "pe": 2, "ked": 4, "rel": 95, "rcs": 1, "month": 4, "hour": 12, "sunspots_r12": 100},
-        "environment": {"elevation": 1, "landcover": 1, "buildings": 0, "obstacles": 0, "clt": "Minimal.clt"},
-        "output": {"units": "m", "col": tpl["col"], "out": 2, "ber": 1, "mod": 7, "nf": -120, "res": 30, "rad": 10}
-    }
-
-    cloudrf_data = await _call_cloudrf_api(payload, client)
-    imagem_url = cloudrf_data.get("PNG_WGS84")
-    bounds = cloudrf_data.get("bounds")
-
-    # --- INÍCIO DA CORREÇÃO ---
-    if not imagem_url or not bounds or len(bounds) != 4:
-        raise HTTPException(status_code=500, detail="Resposta da API CloudRF inválida (sem URL/Bounds).")
-
-    south, west, north, east = bounds[0], bounds[1], bounds[2], bounds[3]
-    if north < south:
-        print(f"⚠️  Bounds Norte/Sul invertidos detectados! (N:{north} < S:{south}). Corrigindo...")
-        bounds = [north, west, south, east] # Inverte N e S
-    # --- FIM DA CORREÇÃO ---
+    payload = montar_payload(tpl, request_data.lat, request_data.lon, request_data.altura, "Network")
 
     lat_str = format_coord_for_filename(request_data.lat)
     lon_str = format_coord_for_filename(request_data.lon)
-    nome_arquivo_base = f"sinal_{tpl['id'].lower()}_{lat_str}_{lon_str}"
+    nome_arquivo_base = f"sinal_e{estudo_id}_{tpl['id'].lower()}_{lat_str}_{lon_str}"
     caminho_imagem_local = os.path.join(STATIC_IMAGENS_DIR, f"{nome_arquivo_base}.png")
-    caminho_json_bounds = os.path.join(STATIC_IMAGENS_DIR, f"{nome_arquivo_base}.json")
 
-    await _download_and_save_image(imagem_url, caminho_imagem_local, client)
-    with open(caminho_json_bounds, "w") as f:
-        json.dump({"bounds": bounds}, f) # Salva bounds corrigidos
+    # Resultado especulativo (disparado no upload do KMZ) com o mesmo payload, se houver
+    bounds = await reivindicar_especulacao(payload, caminho_imagem_local)
+    if bounds is None:
+        bounds = await _simular_cloudrf(payload, caminho_imagem_local, client)
 
     pivos_com_status = detectar_pivos_fora(bounds, [p.model_dump() for p in request_data.pivos_atuais], caminho_imagem_local)
+    _adicionar_sinal(pivos_com_status, bounds, caminho_imagem_local, tpl)
+    store.registrar_simulacao(
+        estudo_id, "principal", tpl["id"], request_data.lat, request_data.lon, request_data.altura,
+        request_data.altura_receiver, f"{nome_arquivo_base}.png", bounds, pivos_com_status
+    )
 
     url_imagem_publica = f"{get_base_url(http_request)}/static/imagens/{nome_arquivo_base}.png"
 
@@ -126,58 +104,30 @@ async def simular_sinal_endpoint(request_data: SimularSinalRequest, http_request
     )
 
 
-@router.post("/simular_manual", response_model=SimulationResponse, tags=["Simulation"])
-async def simular_manual_endpoint(request_data: SimularManualRequest, http_request: Request, client: httpx.AsyncClient = Depends(get_http_session)):
+@router.post("/simular_manual", response_model=SimulationResponse, response_class=ORJSONResponse, tags=["Simulation"])
+async def simular_manual_endpoint(request_data: SimularManualRequest, http_request: Request, client: "httpx.AsyncClient" = Depends(get_http_session), store: EstudoStore = Depends(get_estudo_store)):
     print(f"📡 Simulação Manual (Repetidora) recebida para Lat: {request_data.lat}, Lon: {request_data.lon}")
     try:
         tpl = obter_template(request_data.template)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
+    estudo_id = _resolver_estudo(store, request_data.estudo_id)
 
-    # Limpeza (código mantido)
-    for f_name in os.listdir(STATIC_IMAGENS_DIR):
-        if f_name.startswith("repetidora_") and (f_name.endswith(".png") or f_name.endswith(".json")):
-            try:
-                os.remove(os.path.join(STATIC_IMAGENS_DIR, f_name))
-            except OSError as e_remove:
-                print(f"Aviso: Não foi possível remover arquivo antigo {f_name}: {e_remove}")
-                
-    payload = { # (código mantido)
-        "version": "CloudRF-API-v3.24", "site": tpl["site"], "network": "Modo Expert", "engine": 2, "coordinates": 1,
-        "transmitter": {"lat": request_data.lat, "lon": request_data.lon, "alt": request_data.altura, "frq": tpl["frq"], "txw": tpl["transmitter"]["txw"], "bwi": tpl["transmitter"]["bwi"], "powerUnit": "W"},
-        "receiver": {**tpl["receiver"], "alt": request_data.altura_receiver},
-        "feeder": {"flt": 1, "fll": 0, "fcc": 0},
-        "antenna": {**tpl["antenna"], "mode": "template", "txl": 0, "ant": 1, "azi": 0, "tlt": 0, "hbw": 360, "vbw": 90, "pol": "v"},
-        "model": {"pm": 1, "pe": 2, "ked": 4, "rel": 95, "rcs": 1, "month": 4, "hour": 12, "sunspots_r12": 100},
-        "environment": {"elevation": 1, "landcover": 1, "buildings": 0, "obstacles": 0, "clt": "Minimal.clt"},
-        "output": {"units": "m", "col": tpl["col"], "out": 2, "ber": 1, "mod": 7, "nf": -120, "res": 30, "rad": 10}
-    }
-
-    cloudrf_data = await _call_cloudrf_api(payload, client)
-    imagem_url = cloudrf_data.get("PNG_WGS84")
-    bounds = cloudrf_data.get("bounds")
-
-    # --- INÍCIO DA CORREÇÃO ---
-    if not imagem_url or not bounds or len(bounds) != 4:
-        raise HTTPException(status_code=500, detail="Resposta da API CloudRF inválida (sem URL/Bounds).")
-
-    south, west, north, east = bounds[0], bounds[1], bounds[2], bounds[3]
-    if north < south:
-        print(f"⚠️  Bounds Norte/Sul invertidos detectados! (N:{north} < S:{south}). Corrigindo...")
-        bounds = [north, west, south, east] # Inverte N e S
-    # --- FIM DA CORREÇÃO ---
+    payload = montar_payload(tpl, request_data.lat, request_data.lon, request_data.altura, "Modo Expert", altura_receiver=request_data.altura_receiver)
 
     lat_str = format_coord_for_filename(request_data.lat)
     lon_str = format_coord_for_filename(request_data.lon)
-    nome_arquivo_base = f"repetidora_{tpl['id'].lower()}_{lat_str}_{lon_str}"
+    nome_arquivo_base = f"repetidora_e{estudo_id}_{tpl['id'].lower()}_{lat_str}_{lon_str}"
     caminho_imagem_local = os.path.join(STATIC_IMAGENS_DIR, f"{nome_arquivo_base}.png")
-    caminho_json_bounds = os.path.join(STATIC_IMAGENS_DIR, f"{nome_arquivo_base}.json")
 
-    await _download_and_save_image(imagem_url, caminho_imagem_local, client)
-    with open(caminho_json_bounds, "w") as f:
-        json.dump({"bounds": bounds}, f) # Salva bounds corrigidos
+    bounds = await _simular_cloudrf(payload, caminho_imagem_local, client)
 
     pivos_com_status_nesta_imagem = detectar_pivos_fora(bounds, [p.model_dump() for p in request_data.pivos_atuais], caminho_imagem_local)
+    _adicionar_sinal(pivos_com_status_nesta_imagem, bounds, caminho_imagem_local, tpl)
+    store.registrar_simulacao(
+        estudo_id, "repetidora", tpl["id"], request_data.lat, request_data.lon, request_data.altura,
+        request_data.altura_receiver, f"{nome_arquivo_base}.png", bounds, pivos_com_status_nesta_imagem
+    )
 
     url_imagem_publica = f"{get_base_url(http_request)}/static/imagens/{nome_arquivo_base}.png"
 
@@ -189,58 +139,150 @@ async def simular_manual_endpoint(request_data: SimularManualRequest, http_reque
     )
 
 
-@router.post("/reavaliar_pivos", response_model=ReavaliarPivosResponse, tags=["Simulation"])
-async def reavaliar_pivos_endpoint(request_data: ReavaliarPivosRequest):
+@router.post("/reavaliar_pivos", response_model=ReavaliarPivosResponse, response_class=ORJSONResponse, tags=["Simulation"])
+async def reavaliar_pivos_endpoint(request_data: ReavaliarPivosRequest, store: EstudoStore = Depends(get_estudo_store)):
     pivos_input = request_data.pivos
-    overlays_input = request_data.overlays
+    pivos_dict = [p.model_dump() for p in pivos_input]
     pivos_cobertura_final = {p.nome: False for p in pivos_input}
+    artefatos = {}
+    for overlay_data in request_data.overlays:
+        nome_arquivo_imagem = overlay_data.imagem.split('/')[-1]
+        artefatos[nome_arquivo_imagem] = store.obter_artefato(nome_arquivo_imagem)
+
+    for overlay_data in request_data.overlays:
+        pendentes = [p for p in pivos_dict if not pivos_cobertura_final[p["nome"]]]
+        if not pendentes:
+            break
 
-    for overlay_data in overlays_input:
-        bounds = overlay_data.bounds
-
-        # --- INÍCIO DA CORREÇÃO (Também aqui por segurança) ---
-        if not bounds or len(bounds) != 4:
-            print(f"Aviso: Bounds inválidos recebidos em /reavaliar_pivos. Pulando overlay.")
+        nome_arquivo_imagem = overlay_data.imagem.split('/')[-1]
+        artefato = artefatos[nome_arquivo_imagem]
+
+        if artefato is not None:
+            # 🗄️ Reaproveita a cobertura calculada na simulação; só pivôs novos ou movidos vão para a imagem
+            bounds = artefato["bounds"]
+            coberturas_salvas = store.obter_coberturas(artefato["simulacao_id"])
+            a_checar = []
+            for p in pendentes:
+                salvo = coberturas_salvas.get(p["nome"])
+                if salvo is not None and mesma_posicao(salvo, p):
+                    pivos_cobertura_final[p["nome"]] = not salvo["fora"]
+                else:
+                    a_checar.append(p)
+        else:
+            bounds = overlay_data.bounds
+            if not bounds or len(bounds) != 4:
+                print(f"Aviso: Bounds inválidos recebidos em /reavaliar_pivos. Pulando overlay.")
+                continue
+            bounds = corrigir_bounds(bounds)
+            a_checar = pendentes
+
+        if a_checar:
+            caminho_imagem_servidor = os.path.join(STATIC_IMAGENS_DIR, nome_arquivo_imagem)
+            for nome, coberto in reavaliar_cobertura(a_checar, [(bounds, caminho_imagem_servidor)]).items():
+                if coberto:
+                    pivos_cobertura_final[nome] = True
+
+    # 📶 Melhor sinal de cada pivô entre os overlays do estudo (grades já decodificadas: só leitura do mmap)
+    melhor_sinal = {}
+    for nome_arquivo_imagem, artefato in artefatos.items():
+        if artefato is None:
             continue
-            
-        south, west, north, east = bounds[0], bounds[1], bounds[2], bounds[3]
-        if north < south:
-            print(f"⚠️  Bounds Norte/Sul invertidos detectados em /reavaliar_pivos! Corrigindo...")
-            bounds = [north, west, south, east]
-        # --- FIM DA CORREÇÃO ---
-
-        imagem_url_completa = overlay_data.imagem
-        nome_arquivo_imagem = imagem_url_completa.split('/')[-1]
-        caminho_imagem_servidor = os.path.join(STATIC_IMAGENS_DIR, nome_arquivo_imagem)
-
-        if not os.path.exists(caminho_imagem_servidor):
-            print(f"Aviso: Imagem para reavaliação não encontrada: {caminho_imagem_servidor}")
+        try:
+            tpl_overlay = obter_template(artefato["template"])
+        except ValueError:
             continue
-
-        pivos_para_checar_neste_overlay = [p for p in pivos_input if not pivos_cobertura_final[p.nome]]
-        if not pivos_para_checar_neste_overlay:
-            break
-
-        pivos_status_neste_overlay = detectar_pivos_fora(
-            bounds, # Usa bounds corrigidos
-            [p.model_dump() for p in pivos_para_checar_neste_overlay],
-            caminho_imagem_servidor
-        )
-
-        for p_status in pivos_status_neste_overlay:
-            if not p_status["fora"]:
-                pivos_cobertura_final[p_status["nome"]] = True
+        status_overlay = [dict(p) for p in pivos_dict]
+        _adicionar_sinal(status_overlay, artefato["bounds"], os.path.join(STATIC_IMAGENS_DIR, nome_arquivo_imagem), tpl_overlay)
+        for p in status_overlay:
+            atual = melhor_sinal.get(p["nome"])
+            if p.get("margem_db") is not None and (atual is None or p["margem_db"] > atual["margem_db"]):
+                melhor_sinal[p["nome"]] = {"sinal_dbm": p["sinal_dbm"], "margem_db": p["margem_db"]}
 
     pivos_resultado_final = [
-        PivoData(nome=p.nome, lat=p.lat, lon=p.lon, fora=not pivos_cobertura_final[p.nome])
+        PivoData(nome=p.nome, lat=p.lat, lon=p.lon, fora=not pivos_cobertura_final[p.nome], **melhor_sinal.get(p.nome, {}))
         for p in pivos_input
     ]
 
     return ReavaliarPivosResponse(pivos=pivos_resultado_final)
 
 
+@router.post("/atualizar_cobertura", response_model=AtualizarCoberturaResponse, response_class=ORJSONResponse, tags=["Simulation"])
+async def atualizar_cobertura_endpoint(request_data: AtualizarCoberturaRequest, store: EstudoStore = Depends(get_estudo_store)):
+    # 🧮 Versão incremental de /reavaliar_pivos: o servidor guarda, por overlay, o bitset dos pivôs
+    # cobertos e só avalia o que o delta mudou (overlays novos, pivôs novos ou movidos)
+    estudo_id = _resolver_estudo(store, request_data.estudo_id)
+    camadas = {nome: decodificar_camada(row) for nome, row in store.obter_camadas(estudo_id).items()}
+    alteradas = set()
+
+    adicionar = [imagem.split('/')[-1] for imagem in request_data.adicionar]
+    remover = [imagem.split('/')[-1] for imagem in request_data.remover]
+    conflitos = sorted(set(adicionar) & set(remover))
+    if conflitos:
+        raise HTTPException(status_code=400, detail=f"Overlays em 'adicionar' e 'remover' ao mesmo tempo: {', '.join(conflitos)}.")
+
+    artefatos_novos = {}
+    for nome in adicionar:
+        if nome in camadas or nome in artefatos_novos:
+            continue
+        artefato = store.obter_artefato(nome)
+        if artefato is None or artefato["estudo_id"] != estudo_id:
+            raise HTTPException(status_code=404, detail=f"Overlay {nome} não encontrado no estudo {estudo_id}.")
+        artefatos_novos[nome] = artefato
+
+    # Tudo é calculado em memória e gravado de uma vez no fim: se algo falhar no meio,
+    # o estado salvo (ordem dos pivôs + bitsets das camadas) continua coerente
+    pivos = store.obter_pivos_cobertura(estudo_id)
+    pivos_alterados = None
+    if request_data.pivos is not None:
+        novos = [p.model_dump() for p in request_data.pivos]
+        mapa = mapear_pivos(pivos, novos)
+        if len(novos) != len(pivos) or mapa != list(range(len(novos))):
+            for camada in camadas.values():
+                remapear_camada(camada, mapa)
+            alteradas.update(camadas)
+            pivos = pivos_alterados = novos
+
+    for nome in remover:
+        camadas.pop(nome, None)
+        alteradas.discard(nome)
+
+    for nome in (imagem.split('/')[-1] for imagem in request_data.ocultar):
+        if nome in camadas and camadas[nome]["visivel"]:
+            camadas[nome]["visivel"] = False
+            alteradas.add(nome)
+
+    for nome in adicionar:
+        if nome in artefatos_novos:
+            camadas[nome] = nova_camada(artefatos_novos.pop(nome), len(pivos))
+        camadas[nome]["visivel"] = True
+        alteradas.add(nome)
+
+    # Overlays ocultos só são avaliados quando voltarem a ficar visíveis
+    for nome, camada in camadas.items():
+        indices = pendentes(camada, len(pivos)) if camada["visivel"] else []
+        if indices:
+            avaliar_pendentes(camada, pivos, indices, store.obter_coberturas(camada["simulacao_id"]), STATIC_IMAGENS_DIR)
+            alteradas.add(nome)
+
+    store.aplicar_delta_cobertura(estudo_id, pivos_alterados, remover, [codificar_camada(camadas[nome]) for nome in alteradas])
+
+    cobertos, melhor_sinal = combinar_camadas(list(camadas.values()), len(pivos))
+    pivos_resultado = []
+    for i, p in enumerate(pivos):
+        sinal_dbm, margem_db = melhor_sinal[i] or (None, None)
+        pivos_resultado.append(PivoData(
+            nome=p["nome"], lat=p["lat"], lon=p["lon"], fora=not cobertos >> i & 1,
+            sinal_dbm=sinal_dbm, margem_db=margem_db
+        ))
+
+    return AtualizarCoberturaResponse(
+        pivos=pivos_resultado,
+        camadas_visiveis=[nome for nome, camada in camadas.items() if camada["visivel"]]
+    )
+
+
 @router.post("/perfil_elevacao", response_model=PerfilElevacaoResponse, tags=["Simulation"])
-async def perfil_elevacao_endpoint(request_data: PerfilElevacaoRequest, client: httpx.AsyncClient = Depends(get_http_session)):
+async def perfil_elevacao_endpoint(request_data: PerfilElevacaoRequest, client: "httpx.AsyncClient" = Depends(get_http_session)):
     pontos = request_data.pontos
     alt1 = request_data.altura_antena
     alt2 = request_data.altura_receiver
@@ -258,6 +300,8 @@ async def perfil_elevacao_endpoint(request_data: PerfilElevacaoRequest, client:
     coords_param = "|".join([f"{lat:.6f},{lon:.6f}" for lat, lon in amostrados])
     url_opentopo = f"https://api.opentopodata.org/v1/srtm90m?locations={coords_param}"
 
+    import httpx
+
     try:
         resp_opentopo = await client.get(url_opentopo, timeout=60.0) # Aumentado timeout
         resp_opentopo.raise_for_status()
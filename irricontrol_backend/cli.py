@@ -0,0 +1,247 @@
+"""
+🖥️ Estudos de cobertura em lote, sem navegador.
+
+Roda, para cada KMZ/KML de uma pasta, o mesmo fluxo do frontend:
+parse do KMZ → simulação da antena principal → repetidoras nos pivôs
+que ficaram sem sinal → reavaliação → exportação do KMZ do estudo.
+
+Uso (a partir de irricontrol_backend/):
+    python cli.py PASTA_FAZENDAS --saida estudos/ --template Brazil_V6 --concorrencia 4
+
+Cada fazenda ganha uma pasta em --saida com as imagens, o KMZ final e um
+checkpoint.json. Um lote interrompido pode ser relançado com o mesmo
+comando: simulações já registradas no checkpoint não são refeitas.
+"""
+import argparse
+import asyncio
+import csv
+import hashlib
+import json
+import os
+import sys
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from core.config import HTTP_TIMEOUT, obter_template
+from services.cloudrf_service import CloudRFError, montar_payload, simular_cobertura
+from services.image_analysis import reavaliar_cobertura
+from services.kmz_export import gerar_kmz_estudo
+from services.kmz_parser import parse_kmz
+from utils.file_helpers import format_coord, normalizar_nome
+
+
+EXTENSOES_FAZENDA = (".kmz", ".kml")
+CAMPOS_RESUMO = ["fazenda", "arquivo", "status", "pivos_total", "pivos_cobertos", "pivos_fora", "repetidoras", "kmz", "erro"]
+
+
+def _carregar_checkpoint(caminho: str) -> Dict[str, Any]:
+    if os.path.exists(caminho):
+        with open(caminho, "r") as f:
+            return json.load(f)
+    return {"simulacoes": {}, "concluido": False}
+
+
+def _assinatura(dados: Dict[str, Any]) -> str:
+    # Hash estável do que foi (ou será) simulado: muda se template, posição ou alturas mudarem
+    return hashlib.sha256(json.dumps(dados, sort_keys=True).encode()).hexdigest()
+
+
+def _salvar_checkpoint(caminho: str, checkpoint: Dict[str, Any]) -> None:
+    # Grava em arquivo temporário e troca, para não corromper o checkpoint se o processo morrer no meio
+    caminho_tmp = f"{caminho}.tmp"
+    with open(caminho_tmp, "w") as f:
+        json.dump(checkpoint, f, ensure_ascii=False, indent=2)
+    os.replace(caminho_tmp, caminho)
+
+
+async def _simular_com_checkpoint(
+    chave: str,
+    tipo: str,
+    lat: float,
+    lon: float,
+    altura: float,
+    payload: Dict[str, Any],
+    tpl: Dict[str, Any],
+    pasta: str,
+    checkpoint: Dict[str, Any],
+    caminho_checkpoint: str,
+    client: httpx.AsyncClient,
+) -> Dict[str, Any]:
+    # 💰 Simulações são pagas: só chama a CloudRF se não houver resultado salvo com imagem no disco
+    # e com exatamente o mesmo payload (outro --template ou --altura-repetidora refaz a simulação)
+    assinatura = _assinatura(payload)
+    sim = checkpoint["simulacoes"].get(chave)
+    if sim and sim.get("payload_sha256") == assinatura and os.path.exists(os.path.join(pasta, sim["imagem"])):
+        print(f"↩️  {os.path.basename(pasta)}: reaproveitando {chave} do checkpoint")
+        return sim
+
+    nome_imagem = f"{tipo}_{tpl['id'].lower()}_{format_coord(lat)}_{format_coord(lon)}.png"
+    bounds = await simular_cobertura(payload, os.path.join(pasta, nome_imagem), client)
+
+    sim = {"imagem": nome_imagem, "bounds": bounds, "lat": lat, "lon": lon, "altura": altura, "payload_sha256": assinatura}
+    checkpoint["simulacoes"][chave] = sim
+    _salvar_checkpoint(caminho_checkpoint, checkpoint)
+    return sim
+
+
+def nomes_das_fazendas(arquivos: List[str]) -> Dict[str, str]:
+    """
+    Pasta de saída de cada arquivo: o nome normalizado. Quando dois arquivos caem
+    no mesmo nome (`Faz-1.kmz` e `faz1.kml`, `x.kmz` e `x.kml`), cada um ganha um
+    sufixo com o hash do nome original, estável entre execuções do mesmo lote.
+    """
+    bases = {c: normalizar_nome(os.path.splitext(os.path.basename(c))[0]) or "fazenda" for c in arquivos}
+    repetidos = Counter(bases.values())
+    return {
+        caminho: base if repetidos[base] == 1
+        else f"{base}_{hashlib.sha256(os.path.basename(caminho).encode()).hexdigest()[:8]}"
+        for caminho, base in bases.items()
+    }
+
+
+async def processar_fazenda(
+    caminho_kmz: str,
+    fazenda: str,
+    args: argparse.Namespace,
+    tpl: Dict[str, Any],
+    client: httpx.AsyncClient,
+) -> Dict[str, Any]:
+    nome_arquivo = os.path.basename(caminho_kmz)
+    pasta = os.path.join(args.saida, fazenda)
+    os.makedirs(pasta, exist_ok=True)
+
+    caminho_checkpoint = os.path.join(pasta, "checkpoint.json")
+    checkpoint = _carregar_checkpoint(caminho_checkpoint)
+    # Só pula a fazenda se ela foi concluída com os mesmos parâmetros do lote atual
+    parametros = _assinatura({"template": tpl, "max_repetidoras": args.max_repetidoras,
+                              "altura_repetidora": args.altura_repetidora})
+    if checkpoint.get("concluido") and checkpoint.get("resumo") and checkpoint.get("parametros_sha256") == parametros:
+        print(f"⏭️  {fazenda}: já concluída, pulando")
+        return checkpoint["resumo"]
+
+    resumo = {"fazenda": fazenda, "arquivo": nome_arquivo, "status": "erro", "pivos_total": 0,
+              "pivos_cobertos": 0, "pivos_fora": 0, "repetidoras": 0, "kmz": "", "erro": ""}
+
+    try:
+        antena, pivos, ciclos, _ = await asyncio.to_thread(parse_kmz, caminho_kmz)
+        if not antena:
+            raise ValueError("Antena não encontrada no KMZ")
+        resumo["pivos_total"] = len(pivos)
+
+        # 📡 Antena principal
+        payload = montar_payload(tpl, antena["lat"], antena["lon"], antena["altura"], "Network")
+        principal = await _simular_com_checkpoint(
+            "principal", "sinal", antena["lat"], antena["lon"], antena["altura"],
+            payload, tpl, pasta, checkpoint, caminho_checkpoint, client
+        )
+        overlays = [(principal["bounds"], os.path.join(pasta, principal["imagem"]))]
+        cobertura = await asyncio.to_thread(reavaliar_cobertura, pivos, overlays)
+
+        # 🔁 Repetidoras nos pivôs ainda descobertos (sempre o primeiro, na ordem do KMZ,
+        # para que um lote retomado escolha os mesmos pontos e reaproveite o checkpoint).
+        # Um pivô já usado como alvo não é escolhido de novo, mesmo que continue descoberto
+        # (ex.: imagem ilegível): seria a mesma chamada paga outra vez.
+        repetidoras = []
+        alvos_usados = set()
+        while len(repetidoras) < args.max_repetidoras:
+            indice_alvo = next(
+                (i for i, p in enumerate(pivos) if not cobertura[p["nome"]] and i not in alvos_usados), None
+            )
+            if indice_alvo is None:
+                break
+            alvos_usados.add(indice_alvo)
+            alvo = pivos[indice_alvo]
+
+            indice = len(repetidoras) + 1
+            payload = montar_payload(tpl, alvo["lat"], alvo["lon"], args.altura_repetidora, "Modo Expert",
+                                     altura_receiver=antena.get("altura_receiver", 3))
+            rep = await _simular_com_checkpoint(
+                f"repetidora_{indice}", "repetidora", alvo["lat"], alvo["lon"], args.altura_repetidora,
+                payload, tpl, pasta, checkpoint, caminho_checkpoint, client
+            )
+            repetidoras.append({**rep, "nome": alvo["nome"]})
+            overlays.append((rep["bounds"], os.path.join(pasta, rep["imagem"])))
+            cobertura = await asyncio.to_thread(reavaliar_cobertura, pivos, overlays)
+
+        pivos_com_status = [{**p, "fora": not cobertura[p["nome"]]} for p in pivos]
+
+        # 📦 Exportação
+        caminho_kmz_estudo = os.path.join(pasta, f"EstudoIrricontrol_{fazenda}.kmz")
+        await asyncio.to_thread(
+            gerar_kmz_estudo, antena, pivos_com_status, ciclos, caminho_kmz_estudo, pasta,
+            principal["imagem"], principal["bounds"], repetidoras
+        )
+
+        cobertos = sum(1 for coberto in cobertura.values() if coberto)
+        resumo.update({"status": "ok", "pivos_cobertos": cobertos, "pivos_fora": len(pivos) - cobertos,
+                       "repetidoras": len(repetidoras), "kmz": caminho_kmz_estudo})
+        checkpoint.update({"concluido": True, "resumo": resumo, "parametros_sha256": parametros})
+        _salvar_checkpoint(caminho_checkpoint, checkpoint)
+        print(f"✅ {fazenda}: {cobertos}/{len(pivos)} pivôs cobertos, {len(repetidoras)} repetidora(s)")
+
+    except CloudRFError as e:
+        resumo["erro"] = e.detail
+        print(f"❌ {fazenda}: {e.detail}")
+    except Exception as e:
+        resumo["erro"] = str(e)
+        print(f"❌ {fazenda}: {str(e)}")
+
+    return resumo
+
+
+async def executar_lote(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    tpl = obter_template(args.template)
+    arquivos = sorted(
+        os.path.join(args.pasta, nome) for nome in os.listdir(args.pasta)
+        if nome.lower().endswith(EXTENSOES_FAZENDA)
+    )
+    print(f"📚 {len(arquivos)} fazenda(s) encontrada(s) em {args.pasta}")
+    os.makedirs(args.saida, exist_ok=True)
+
+    limite = asyncio.Semaphore(args.concorrencia)
+    fazendas = nomes_das_fazendas(arquivos)
+
+    async def com_limite(caminho: str, client: httpx.AsyncClient) -> Dict[str, Any]:
+        async with limite:
+            return await processar_fazenda(caminho, fazendas[caminho], args, tpl, client)
+
+    async with httpx.AsyncClient(timeout=httpx.Timeout(HTTP_TIMEOUT)) as client:
+        return await asyncio.gather(*(com_limite(caminho, client) for caminho in arquivos))
+
+
+def escrever_resumo(caminho: str, resumos: List[Dict[str, Any]]) -> None:
+    with open(caminho, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=CAMPOS_RESUMO)
+        writer.writeheader()
+        writer.writerows(resumos)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Executa estudos de cobertura Irricontrol em lote.")
+    parser.add_argument("pasta", help="Pasta com os KMZ/KML das fazendas")
+    parser.add_argument("--saida", default="estudos", help="Pasta de saída (imagens, KMZs, checkpoints e resumo)")
+    parser.add_argument("--template", default="Brazil_V6", help="ID do template de simulação")
+    parser.add_argument("--concorrencia", type=int, default=4, help="Máximo de fazendas simultâneas")
+    parser.add_argument("--max-repetidoras", type=int, default=0, help="Máximo de repetidoras automáticas por fazenda")
+    parser.add_argument("--altura-repetidora", type=int, default=5, help="Altura (m) das repetidoras automáticas")
+    args = parser.parse_args(argv)
+
+    if args.concorrencia < 1:
+        parser.error("--concorrencia deve ser pelo menos 1")
+
+    try:
+        resumos = asyncio.run(executar_lote(args))
+    except ValueError as e:
+        parser.error(str(e))
+
+    caminho_resumo = os.path.join(args.saida, "resumo.csv")
+    escrever_resumo(caminho_resumo, resumos)
+    falhas = sum(1 for r in resumos if r["status"] != "ok")
+    print(f"📝 Resumo salvo em {caminho_resumo} ({len(resumos) - falhas} ok, {falhas} com erro)")
+    return 1 if falhas else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,12 +1,50 @@
 import os
-from dotenv import load_dotenv
 
-load_dotenv() # Carrega variáveis de .env se existir (para desenvolvimento local)
+# Carrega variáveis do .env da raiz do backend, se existir (para desenvolvimento local).
+# Caminho explícito e import só quando o arquivo existe: em produção não há busca
+# de .env pelo sistema de arquivos nem import do dotenv no cold start.
+_ENV_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".env")
+if os.path.isfile(_ENV_PATH):
+    from dotenv import load_dotenv
+    load_dotenv(_ENV_PATH)
 
 API_URL = "https://api.cloudrf.com/area"
 API_KEY = os.getenv("CLOUDRF_API_KEY", "35113-e181126d4af70994359d767890b3a4f2604eb0ef") # Fallback para a chave antiga se não definida no env
 HTTP_TIMEOUT = 60.0
 
+# Aquece imports pesados e caches em segundo plano ao iniciar a API (ver /ready)
+WARMUP_NA_INICIALIZACAO = os.getenv("WARMUP_NA_INICIALIZACAO", "1") == "1"
+
+# Processamento de KMZs em lote (um processo por núcleo, por padrão)
+KMZ_LOTE_WORKERS = int(os.getenv("KMZ_LOTE_WORKERS", "0")) or (os.cpu_count() or 1)
+# Limites do lote (o endpoint é público: protege contra ZIP bomb e uploads gigantes)
+KMZ_LOTE_MAX_ARQUIVOS = int(os.getenv("KMZ_LOTE_MAX_ARQUIVOS", "200"))
+KMZ_LOTE_MAX_ARQUIVO_MB = float(os.getenv("KMZ_LOTE_MAX_ARQUIVO_MB", "50")) # Por KMZ/KML, já descompactado
+KMZ_LOTE_MAX_TOTAL_MB = float(os.getenv("KMZ_LOTE_MAX_TOTAL_MB", "500"))
+
+# Retenção dos estudos: apaga (banco, PNGs e grades) os sem atividade há ESTUDOS_TTL_DIAS
+# e os que passarem dos ESTUDOS_MAX mais recentes. 0 desliga o respectivo limite.
+ESTUDOS_TTL_DIAS = float(os.getenv("ESTUDOS_TTL_DIAS", "7"))
+ESTUDOS_MAX = int(os.getenv("ESTUDOS_MAX", "500"))
+
+# Simulação especulativa da antena principal logo após o upload do KMZ (opt-in).
+# Cota e resultado ficam no banco de estudos: com vários workers, qualquer um aproveita o resultado.
+SIMULACAO_ESPECULATIVA = os.getenv("SIMULACAO_ESPECULATIVA", "0") == "1"
+ESPECULACAO_TEMPLATE = os.getenv("ESPECULACAO_TEMPLATE", "Brazil_V6") # Template padrão do frontend
+ESPECULACAO_TTL_S = float(os.getenv("ESPECULACAO_TTL_S", "600")) # Tempo que um resultado fica à espera do clique
+# Cota da CloudRF (chamadas por janela) e a fração dela que a especulação pode consumir
+CLOUDRF_COTA_JANELA = int(os.getenv("CLOUDRF_COTA_JANELA", "100"))
+CLOUDRF_JANELA_S = float(os.getenv("CLOUDRF_JANELA_S", "86400"))
+ESPECULACAO_FRACAO_COTA = float(os.getenv("ESPECULACAO_FRACAO_COTA", "0.1"))
+
+# 🔬 Perfilamento sob demanda de /simulation e /kmz (header X-Perfil ou ?perfil= com o token).
+# Sem PERFIL_TOKEN o middleware nem é instalado.
+PERFIL_TOKEN = os.getenv("PERFIL_TOKEN", "")
+PERFIL_LIMITE_JANELA = int(os.getenv("PERFIL_LIMITE_JANELA", "10")) # Perfis permitidos por janela
+PERFIL_JANELA_S = float(os.getenv("PERFIL_JANELA_S", "3600"))
+PERFIL_LIMITE_FALHAS = int(os.getenv("PERFIL_LIMITE_FALHAS", "10")) # Tokens inválidos aceitos por janela antes do 429
+PERFIL_INTERVALO_S = float(os.getenv("PERFIL_INTERVALO_S", "0.005")) # Intervalo de amostragem
+
 # Templates disponíveis no sistema
 TEMPLATES_DISPONIVEIS = [
     {
@@ -25,6 +63,13 @@ TEMPLATES_DISPONIVEIS = [
     }
 ]
 
+# Escalas de cor da CloudRF (campo "col" do template): cor RGB de cada faixa -> dBm
+# (limite inferior da faixa), conforme a legenda assets/images/IRRICONTRO.dBm.key.png do frontend.
+# Escalas sem entrada aqui não têm o nível de sinal decodificado (só dentro/fora).
+PALETAS_DBM = {
+    "IRRICONTRO.dBm": {(0, 255, 51): -70, (10, 215, 86): -80, (18, 177, 104): -90},
+}
+
 def obter_template(template_id: str):
     template = next((t for t in TEMPLATES_DISPONIVEIS if t["id"] == template_id), None)
     if not template:
@@ -0,0 +1,41 @@
+import asyncio
+import importlib
+import time
+from typing import Any, Dict
+
+from core.config import WARMUP_NA_INICIALIZACAO
+
+
+# Dependências pesadas que os routers só importam no primeiro uso
+MODULOS_AQUECIMENTO = ("httpx", "numpy", "PIL.Image", "simplekml", "shapely.geometry")
+
+estado: Dict[str, Any] = {"pronto": False, "aquecimento_ms": None, "erro": None}
+
+
+def _aquecer() -> None:
+    # Roda em thread: importa os módulos pesados e abre o banco de estudos
+    from services.estudo_store import obter_store
+
+    for modulo in MODULOS_AQUECIMENTO:
+        importlib.import_module(modulo)
+    obter_store()
+
+
+async def aquecer_em_segundo_plano() -> None:
+    inicio = time.perf_counter()
+    try:
+        await asyncio.to_thread(_aquecer)
+    except Exception as e:
+        # Falha no aquecimento não impede a API de atender: cada rota importa o que precisa
+        print(f"⚠️ Erro no aquecimento da API: {e}")
+        estado["erro"] = str(e)
+    estado["aquecimento_ms"] = round((time.perf_counter() - inicio) * 1000, 1)
+    estado["pronto"] = True
+    print(f"🔥 Aquecimento concluído em {estado['aquecimento_ms']} ms")
+
+
+def iniciar_aquecimento() -> None:
+    if WARMUP_NA_INICIALIZACAO:
+        asyncio.get_running_loop().create_task(aquecer_em_segundo_plano())
+    else:
+        estado["pronto"] = True
@@ -10,6 +10,14 @@ STATIC_IMAGENS_DIR = os.path.join(STATIC_DIR, "imagens")
 # Diretório de arquivos temporários
 ARQUIVOS_DIR = os.path.join(BASE_DIR, "arquivos")
 
-# Garante que as pastas existem
-os.makedirs(STATIC_IMAGENS_DIR, exist_ok=True)
-os.makedirs(ARQUIVOS_DIR, exist_ok=True)
+# Relatórios de perfilamento sob demanda (speedscope)
+PERFIS_DIR = os.path.join(ARQUIVOS_DIR, "perfis")
+
+# Banco SQLite dos estudos (fazendas, simulações, artefatos e coberturas)
+ESTUDOS_DB_PATH = os.getenv("ESTUDOS_DB_PATH", os.path.join(ARQUIVOS_DIR, "estudos.sqlite3"))
+
+
+def garantir_diretorios() -> None:
+    # Chamado na inicialização da API (não no import, para não ter efeito colateral)
+    os.makedirs(STATIC_IMAGENS_DIR, exist_ok=True)
+    os.makedirs(ARQUIVOS_DIR, exist_ok=True)
@@ -1,16 +1,35 @@
+import os
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from fastapi.staticfiles import StaticFiles
 
 # ✅ Imports organizados
-from api.routers import core, kmz, simulation
-from core.paths import STATIC_DIR, ARQUIVOS_DIR
+from api.routers import core, kmz, perfis, simulation
+from api.compressao import GZipRespostasDeDados
+from api.perfilamento import PerfilamentoMiddleware
+from core.config import PERFIL_TOKEN
+from core.paths import STATIC_DIR, garantir_diretorios
+from core.inicializacao import estado as estado_inicializacao, iniciar_aquecimento
+from services.kmz_lote import encerrar_executor
+from services.especulacao import encerrar_especulacoes
+
+# ✅ Ciclo de vida: pastas e aquecimento na subida, pool de processos na descida
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    garantir_diretorios()
+    iniciar_aquecimento()
+    yield
+    encerrar_executor()
+    encerrar_especulacoes()
 
 # ✅ Instância do FastAPI
 app = FastAPI(
     title="Irricontrol Simulador API",
     version="1.0.0",
     description="🚀 API oficial do Simulador de Sinal Irricontrol",
+    lifespan=lifespan,
 )
 
 # ✅ CORS
@@ -35,13 +54,23 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# ✅ Montagem dos arquivos estáticos
-app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
+# ✅ Compressão das respostas grandes (KMZ processado, simulações); nível 6 equilibra CPU e tamanho.
+# PNGs e o KMZ exportado já são comprimidos e passam direto.
+app.add_middleware(GZipRespostasDeDados, minimum_size=1000, compresslevel=6)
+
+# ✅ Perfilamento sob demanda de /simulation e /kmz: sem PERFIL_TOKEN nada é instalado (custo zero)
+if PERFIL_TOKEN:
+    app.add_middleware(PerfilamentoMiddleware)
+
+# ✅ Montagem dos arquivos estáticos (a pasta é criada no lifespan)
+app.mount("/static", StaticFiles(directory=STATIC_DIR, check_dir=False), name="static")
 
 # ✅ Rotas
 app.include_router(core.router, prefix="/core", tags=["Core"])
 app.include_router(kmz.router, prefix="/kmz", tags=["KMZ"])
 app.include_router(simulation.router, prefix="/simulation", tags=["Simulation"])
+if PERFIL_TOKEN:
+    app.include_router(perfis.router, prefix="/perfis", tags=["Perfis"])
 
 # ✅ Endpoint raiz
 @app.get("/", tags=["Root"])
@@ -52,3 +81,15 @@ async def read_root():
         "docs": "/docs",
         "static_check": f"Verifique se você pode acessar: /static/imagens/NOME_DA_SUA_IMAGEM.png",
     }
+
+# ✅ Liveness: o processo está de pé
+@app.get("/health", tags=["Root"])
+async def health():
+    return {"status": "ok"}
+
+# ✅ Readiness: aquecimento concluído, pronto para atender sem custo de import
+@app.get("/ready", tags=["Root"])
+async def ready():
+    if not estado_inicializacao["pronto"]:
+        return JSONResponse(status_code=503, content={"status": "aquecendo"})
+    return {"status": "pronto", **estado_inicializacao}
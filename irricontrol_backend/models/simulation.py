@@ -6,6 +6,8 @@ class PivoData(BaseModel):
     lat: float
     lon: float
     fora: Optional[bool] = None # 'fora' é mais um status de resultado
+    sinal_dbm: Optional[int] = None # Nível de sinal no pivô (faixa da escala de cor do template)
+    margem_db: Optional[int] = None # sinal_dbm - rxs do template
 
 class PivoInput(BaseModel): # Apenas dados que o frontend envia para identificar
     nome: str
@@ -22,6 +24,7 @@ class AntenaBase(BaseModel):
 class SimularSinalRequest(AntenaBase):
     template: str
     pivos_atuais: List[PivoInput]
+    estudo_id: Optional[int] = None # Se ausente, usa o estudo mais recente
 
 class SimularManualRequest(BaseModel):
     lat: float
@@ -30,6 +33,7 @@ class SimularManualRequest(BaseModel):
     altura_receiver: Optional[int] = 3
     template: str
     pivos_atuais: List[PivoInput]
+    estudo_id: Optional[int] = None
 
 class OverlayData(BaseModel):
     imagem: str
@@ -39,6 +43,14 @@ class ReavaliarPivosRequest(BaseModel):
     pivos: List[PivoInput]
     overlays: List[OverlayData]
 
+class AtualizarCoberturaRequest(BaseModel):
+    # Delta do estado de cobertura do estudo no servidor (nomes ou URLs das imagens)
+    estudo_id: Optional[int] = None
+    adicionar: List[str] = [] # Overlays que passam a ficar visíveis (novos ou reexibidos)
+    ocultar: List[str] = []
+    remover: List[str] = []
+    pivos: Optional[List[PivoInput]] = None # Só quando os pivôs mudaram (edição/remoção)
+
 class PontoPerfil(BaseModel):
     lat: float
     lon: float
@@ -57,6 +69,7 @@ class ProcessKmzResponse(BaseModel):
     pivos: List[PivoData]
     ciclos: List[Any] # Pode ser mais específico se a estrutura do ciclo for conhecida
     bombas: List[PivoData] # Reutiliza PivoData se a estrutura for similar
+    estudo_id: Optional[int] = None
 
 class SimulationResponse(BaseModel):
     imagem_salva: str
@@ -74,4 +87,7 @@ class PerfilElevacaoResponse(BaseModel):
     elevacao: List[float]
 
 class ReavaliarPivosResponse(BaseModel):
-    pivos: List[PivoData]
\ No newline at end of file
+    pivos: List[PivoData]
+
+class AtualizarCoberturaResponse(ReavaliarPivosResponse):
+    camadas_visiveis: List[str] # Overlays visíveis no estado do servidor após o delta
\ No newline at end of file
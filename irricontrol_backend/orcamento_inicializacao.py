@@ -0,0 +1,100 @@
+"""
+⏱️ Verifica o orçamento de cold start da API.
+
+Importa `main` num processo novo com `python -X importtime`, mostra quais
+pacotes dominam o tempo de import e quanto leva o lifespan (sem aquecimento).
+Falha (exit 1) se o import passar do orçamento ou se alguma dependência
+pesada que deveria ser tardia (core.inicializacao.MODULOS_AQUECIMENTO) for
+importada já no `import main`.
+
+Uso (a partir de irricontrol_backend/):
+    python orcamento_inicializacao.py --orcamento-ms 800 --top 15
+"""
+import argparse
+import os
+import subprocess
+import sys
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+from core.inicializacao import MODULOS_AQUECIMENTO
+
+
+DIRETORIO_BACKEND = os.path.dirname(os.path.abspath(__file__))
+
+SCRIPT_LIFESPAN = """
+import asyncio, time
+import main
+async def _subir():
+    inicio = time.perf_counter()
+    async with main.app.router.lifespan_context(main.app):
+        print(f"LIFESPAN_MS={(time.perf_counter() - inicio) * 1000:.1f}")
+asyncio.run(_subir())
+"""
+
+
+def medir_imports() -> List[Tuple[str, int, int]]:
+    # Devolve (módulo, self_us, cumulativo_us) na ordem em que o -X importtime reporta
+    resultado = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=DIRETORIO_BACKEND, capture_output=True, text=True, check=True,
+    )
+    medicoes = []
+    for linha in resultado.stderr.splitlines():
+        if not linha.startswith("import time:") or "self [us]" in linha:
+            continue
+        self_us, cumulativo_us, modulo = linha[len("import time:"):].split("|")
+        medicoes.append((modulo.strip(), int(self_us), int(cumulativo_us)))
+    return medicoes
+
+
+def medir_lifespan() -> float:
+    env = {**os.environ, "WARMUP_NA_INICIALIZACAO": "0"}
+    resultado = subprocess.run(
+        [sys.executable, "-c", SCRIPT_LIFESPAN],
+        cwd=DIRETORIO_BACKEND, capture_output=True, text=True, check=True, env=env,
+    )
+    for linha in resultado.stdout.splitlines():
+        if linha.startswith("LIFESPAN_MS="):
+            return float(linha.split("=", 1)[1])
+    raise RuntimeError("Não foi possível medir o lifespan da API.")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Orçamento de tempo de import/inicialização da API.")
+    parser.add_argument("--orcamento-ms", type=float, default=800.0, help="Tempo máximo de `import main` (ms)")
+    parser.add_argument("--top", type=int, default=15, help="Quantos pacotes listar")
+    args = parser.parse_args(argv)
+
+    medicoes = medir_imports()
+    total_ms = next(cum for modulo, _, cum in medicoes if modulo == "main") / 1000
+
+    # Soma o tempo próprio de cada módulo no seu pacote de topo
+    por_pacote: Dict[str, int] = defaultdict(int)
+    for modulo, self_us, _ in medicoes:
+        por_pacote[modulo.split(".")[0]] += self_us
+
+    print(f"📦 import main: {total_ms:.1f} ms (orçamento: {args.orcamento_ms:.0f} ms)")
+    print(f"{'pacote':<30}{'ms':>10}{'%':>8}")
+    for pacote, self_us in sorted(por_pacote.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f"{pacote:<30}{self_us / 1000:>10.1f}{100 * self_us / 1000 / total_ms:>7.1f}%")
+
+    print(f"🚀 lifespan (sem aquecimento): {medir_lifespan():.1f} ms")
+
+    falhas = []
+    importados = {modulo for modulo, _, _ in medicoes}
+    for modulo in MODULOS_AQUECIMENTO:
+        if modulo in importados:
+            falhas.append(f"{modulo} é importado no `import main` (deveria ser tardio)")
+    if total_ms > args.orcamento_ms:
+        falhas.append(f"import main levou {total_ms:.1f} ms, acima do orçamento de {args.orcamento_ms:.0f} ms")
+
+    for falha in falhas:
+        print(f"❌ {falha}")
+    if not falhas:
+        print("✅ Dentro do orçamento")
+    return 1 if falhas else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,100 @@
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+from core.config import API_URL as CLOUDRF_API_URL, API_KEY as CLOUDRF_API_KEY
+
+if TYPE_CHECKING:
+    import httpx
+
+
+class CloudRFError(Exception):
+    # Erro da integração com a CloudRF, com o status HTTP a devolver ao cliente
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def montar_payload(
+    tpl: Dict[str, Any],
+    lat: float,
+    lon: float,
+    altura: float,
+    network: str,
+    altura_receiver: Optional[float] = None,
+) -> Dict[str, Any]:
+    receiver = tpl["receiver"] if altura_receiver is None else {**tpl["receiver"], "alt": altura_receiver}
+    return {
+        "version": "CloudRF-API-v3.24", "site": tpl["site"], "network": network, "engine": 2, "coordinates": 1,
+        "transmitter": {"lat": lat, "lon": lon, "alt": altura, "frq": tpl["frq"], "txw": tpl["transmitter"]["txw"], "bwi": tpl["transmitter"]["bwi"], "powerUnit": "W"},
+        "receiver": receiver, "feeder": {"flt": 1, "fll": 0, "fcc": 0},
+        "antenna": {**tpl["antenna"], "mode": "template", "txl": 0, "ant": 1, "azi": 0, "tlt": 0, "hbw": 360, "vbw": 90, "pol": "v"},
+        "model": {"pm": 1, "pe": 2, "ked": 4, "rel": 95, "rcs": 1, "month": 4, "hour": 12, "sunspots_r12": 100},
+        "environment": {"elevation": 1, "landcover": 1, "buildings": 0, "obstacles": 0, "clt": "Minimal.clt"},
+        "output": {"units": "m", "col": tpl["col"], "out": 2, "ber": 1, "mod": 7, "nf": -120, "res": 30, "rad": 10}
+    }
+
+
+def corrigir_bounds(bounds: List[float]) -> List[float]:
+    # [sul, oeste, norte, leste] — a CloudRF às vezes devolve Norte/Sul invertidos
+    south, west, north, east = bounds[0], bounds[1], bounds[2], bounds[3]
+    if north < south:
+        print(f"⚠️  Bounds Norte/Sul invertidos detectados! (N:{north} < S:{south}). Corrigindo...")
+        return [north, west, south, east]
+    return list(bounds)
+
+
+async def chamar_cloudrf(payload: Dict[str, Any], client: "httpx.AsyncClient") -> Dict[str, Any]:
+    import httpx
+
+    headers = {"key": CLOUDRF_API_KEY, "Content-Type": "application/json"}
+    try:
+        # Aumentado o timeout para chamadas mais longas
+        response = await client.post(CLOUDRF_API_URL, headers=headers, json=payload, timeout=90.0)
+        response.raise_for_status()
+        return response.json()
+    except httpx.HTTPStatusError as e:
+        print(f"❌ Erro na API CloudRF: {e.response.status_code} - {e.response.text}")
+        raise CloudRFError(e.response.status_code, f"Erro na API CloudRF: {e.response.text}")
+    except httpx.RequestError as e:
+        print(f"❌ Erro de requisição para CloudRF: {str(e)}")
+        raise CloudRFError(503, f"Não foi possível conectar à API CloudRF: {str(e)}")
+    except ValueError:
+        print(f"❌ Erro ao decodificar JSON da CloudRF. Resposta: {response.text[:500]}")
+        raise CloudRFError(500, "Resposta inválida (não JSON) da API CloudRF.")
+
+
+async def baixar_imagem(image_url: str, local_path: str, client: "httpx.AsyncClient") -> None:
+    import httpx
+
+    try:
+        # Aumentado o timeout para downloads
+        r = await client.get(image_url, timeout=90.0)
+        r.raise_for_status()
+        with open(local_path, "wb") as f:
+            f.write(r.content)
+        print(f"✅ Imagem salva em {local_path}")
+    except httpx.HTTPStatusError as e:
+        print(f"❌ Erro ao baixar imagem {image_url}: Status {e.response.status_code} - {e.response.text}")
+        raise CloudRFError(e.response.status_code, f"Falha ao baixar imagem de sinal: {e.response.text}")
+    except httpx.RequestError as e:
+        print(f"❌ Erro de requisição ao baixar imagem {image_url}: {str(e)}")
+        raise CloudRFError(503, f"Não foi possível baixar a imagem: {str(e)}")
+
+
+async def simular_cobertura(payload: Dict[str, Any], caminho_imagem: str, client: "httpx.AsyncClient") -> List[float]:
+    """
+    Executa uma simulação na CloudRF e salva o PNG de cobertura em `caminho_imagem`.
+
+    Returns:
+        Bounds [sul, oeste, norte, leste] já corrigidos.
+    """
+    cloudrf_data = await chamar_cloudrf(payload, client)
+    imagem_url = cloudrf_data.get("PNG_WGS84")
+    bounds = cloudrf_data.get("bounds")
+
+    if not imagem_url or not bounds or len(bounds) != 4:
+        raise CloudRFError(500, "Resposta da API CloudRF inválida (sem URL/Bounds).")
+
+    bounds = corrigir_bounds(bounds)
+    await baixar_imagem(imagem_url, caminho_imagem, client)
+    return bounds
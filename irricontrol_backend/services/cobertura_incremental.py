@@ -0,0 +1,147 @@
+import os
+from array import array
+from typing import Any, Dict, List, Optional, Tuple
+
+from core.config import obter_template
+from services.image_analysis import detectar_pivos_fora
+from services.sinal_dbm import SEM_SINAL, amostrar_pivos, obter_grade
+
+
+# Uma "camada" é o estado de um overlay dentro de um estudo:
+#   cobertos / avaliados: bitsets (int) em que o bit i é o pivô de ordem i
+#   sinais: nível de sinal (dBm, int8) de cada pivô, SEM_SINAL se não há
+# A cobertura do estudo é o OR dos `cobertos` das camadas visíveis.
+
+
+def _bits_para_blob(bits: int) -> bytes:
+    return bits.to_bytes((bits.bit_length() + 7) // 8, "little")
+
+
+def decodificar_camada(row: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        **row,
+        "cobertos": int.from_bytes(row["cobertos"], "little"),
+        "avaliados": int.from_bytes(row["avaliados"], "little"),
+        "sinais": array("b", row["sinais"]),
+    }
+
+
+def codificar_camada(camada: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        **camada,
+        "cobertos": _bits_para_blob(camada["cobertos"]),
+        "avaliados": _bits_para_blob(camada["avaliados"]),
+        "sinais": camada["sinais"].tobytes(),
+    }
+
+
+def nova_camada(artefato: Dict[str, Any], total_pivos: int) -> Dict[str, Any]:
+    return {
+        "nome_arquivo": artefato["nome_arquivo"],
+        "simulacao_id": artefato["simulacao_id"],
+        "bounds": artefato["bounds"],
+        "template": artefato["template"],
+        "visivel": True,
+        "cobertos": 0,
+        "avaliados": 0,
+        "sinais": array("b", [SEM_SINAL] * total_pivos),
+    }
+
+
+def mesma_posicao(salvo: Dict[str, Any], pivo: Dict[str, Any]) -> bool:
+    return abs(salvo["lat"] - pivo["lat"]) < 1e-9 and abs(salvo["lon"] - pivo["lon"]) < 1e-9
+
+
+def mapear_pivos(antigos: List[Dict[str, Any]], novos: List[Dict[str, Any]]) -> List[Optional[int]]:
+    """
+    Para cada pivô da nova lista, o índice do mesmo pivô (mesmo nome e posição)
+    na lista antiga, ou None se ele é novo ou foi movido.
+    """
+    indices = {p["nome"]: i for i, p in enumerate(antigos)}
+    mapa = []
+    for p in novos:
+        i = indices.get(p["nome"])
+        mapa.append(i if i is not None and mesma_posicao(antigos[i], p) else None)
+    return mapa
+
+
+def remapear_camada(camada: Dict[str, Any], mapa: List[Optional[int]]) -> None:
+    # Leva os bits para a nova ordem dos pivôs; pivôs novos/movidos ficam pendentes de avaliação
+    cobertos = avaliados = 0
+    sinais = array("b", [SEM_SINAL] * len(mapa))
+    for j, i in enumerate(mapa):
+        if i is None or not camada["avaliados"] >> i & 1:
+            continue
+        avaliados |= 1 << j
+        cobertos |= (camada["cobertos"] >> i & 1) << j
+        sinais[j] = camada["sinais"][i]
+    camada.update(cobertos=cobertos, avaliados=avaliados, sinais=sinais)
+
+
+def pendentes(camada: Dict[str, Any], total_pivos: int) -> List[int]:
+    return [i for i in range(total_pivos) if not camada["avaliados"] >> i & 1]
+
+
+def avaliar_pendentes(
+    camada: Dict[str, Any],
+    pivos: List[Dict[str, Any]],
+    indices: List[int],
+    coberturas_salvas: Dict[str, Dict[str, Any]],
+    diretorio_imagens: str,
+) -> None:
+    """
+    Avalia só os pivôs `indices` na camada: reaproveita a cobertura registrada
+    na simulação quando o pivô está na mesma posição e lê a imagem para o resto.
+    """
+    caminho_imagem = os.path.join(diretorio_imagens, camada["nome_arquivo"])
+
+    a_checar = []
+    for i in indices:
+        salvo = coberturas_salvas.get(pivos[i]["nome"])
+        if salvo is not None and mesma_posicao(salvo, pivos[i]):
+            camada["cobertos"] |= (not salvo["fora"]) << i
+        else:
+            a_checar.append(i)
+
+    if a_checar:
+        status = detectar_pivos_fora(camada["bounds"], [pivos[i] for i in a_checar], caminho_imagem)
+        for i, p in zip(a_checar, status):
+            camada["cobertos"] |= (not p["fora"]) << i
+
+    try:
+        grade = obter_grade(caminho_imagem, obter_template(camada["template"])["col"])
+    except ValueError:
+        grade = None
+    if grade is not None:
+        for i, nivel in zip(indices, amostrar_pivos(camada["bounds"], [pivos[i] for i in indices], grade)):
+            camada["sinais"][i] = SEM_SINAL if nivel is None else nivel
+
+    for i in indices:
+        camada["avaliados"] |= 1 << i
+
+
+def combinar_camadas(
+    camadas: List[Dict[str, Any]],
+    total_pivos: int,
+) -> Tuple[int, List[Optional[Tuple[int, int]]]]:
+    """
+    Junta as camadas visíveis: devolve o bitset dos pivôs cobertos e, por pivô,
+    o melhor (sinal_dbm, margem_db) entre elas (None se nenhuma tem sinal).
+    """
+    cobertos = 0
+    melhor_sinal: List[Optional[Tuple[int, int]]] = [None] * total_pivos
+    for camada in camadas:
+        if not camada["visivel"]:
+            continue
+        cobertos |= camada["cobertos"]
+        try:
+            rxs = obter_template(camada["template"])["rxs"]
+        except ValueError:
+            continue
+        for i, nivel in enumerate(camada["sinais"]):
+            if nivel == SEM_SINAL:
+                continue
+            atual = melhor_sinal[i]
+            if atual is None or nivel - rxs > atual[1]:
+                melhor_sinal[i] = (nivel, nivel - rxs)
+    return cobertos, melhor_sinal
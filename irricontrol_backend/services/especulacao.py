@@ -0,0 +1,158 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from core.config import (
+    SIMULACAO_ESPECULATIVA, ESPECULACAO_TEMPLATE, ESPECULACAO_TTL_S,
+    CLOUDRF_COTA_JANELA, CLOUDRF_JANELA_S, ESPECULACAO_FRACAO_COTA, HTTP_TIMEOUT, obter_template,
+)
+from core.paths import ARQUIVOS_DIR
+from services.cloudrf_service import montar_payload, simular_cobertura
+from services.estudo_store import obter_store
+
+
+# O resultado fica no banco (qualquer worker pode reivindicá-lo); aqui só as tarefas
+# que este worker disparou: chave do payload -> tarefa que devolve os bounds
+_tarefas: Dict[str, "asyncio.Task"] = {}
+
+# Quem pede um resultado que outro worker ainda está simulando consulta o banco a
+# cada INTERVALO_CONSULTA_S, por no máximo o tempo da chamada + download da imagem
+INTERVALO_CONSULTA_S = 0.25
+ESPERA_MAXIMA_S = 2 * HTTP_TIMEOUT
+
+
+def _chave(payload: Dict[str, Any]) -> str:
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+
+def _remover_arquivo(caminho: str) -> None:
+    if os.path.exists(caminho):
+        os.remove(caminho)
+
+
+def _limpar_expiradas() -> None:
+    for chave, caminho_tmp in obter_store().remover_especulacoes_expiradas():
+        print("🗑️ Simulação especulativa expirou sem ser usada")
+        tarefa = _tarefas.pop(chave, None)
+        if tarefa is not None and not tarefa.done():
+            tarefa.cancel()
+        _remover_arquivo(caminho_tmp)
+
+
+def _ao_terminar(chave: str, caminho_tmp: str, tarefa: "asyncio.Task") -> None:
+    # Publica os bounds no banco ou descarta; ler a exceção aqui evita o
+    # "Task exception was never retrieved" das especulações que ninguém reivindica
+    if _tarefas.get(chave) is tarefa:
+        del _tarefas[chave]
+    store = obter_store()
+    if tarefa.cancelled():
+        store.descartar_especulacao(chave, caminho_tmp)
+        _remover_arquivo(caminho_tmp)
+        return
+    erro = tarefa.exception()
+    if erro is not None:
+        print(f"⚠️ Simulação especulativa falhou: {erro}")
+        store.descartar_especulacao(chave, caminho_tmp)
+        _remover_arquivo(caminho_tmp)
+    elif not store.concluir_especulacao(chave, caminho_tmp, tarefa.result()):
+        _remover_arquivo(caminho_tmp)
+
+
+async def _executar(payload: Dict[str, Any], caminho_tmp: str) -> List[float]:
+    import httpx
+
+    async with httpx.AsyncClient(timeout=httpx.Timeout(HTTP_TIMEOUT)) as client:
+        return await simular_cobertura(payload, caminho_tmp, client)
+
+
+def iniciar_especulacao(antena: Dict[str, Any]) -> bool:
+    """
+    Dispara em segundo plano a simulação da antena principal com o template padrão,
+    exatamente como /simulation/simular_sinal faria. Devolve True se há uma
+    especulação para ela (disparada agora ou já em andamento em algum worker).
+    """
+    if not SIMULACAO_ESPECULATIVA:
+        return False
+
+    _limpar_expiradas()
+    try:
+        tpl = obter_template(ESPECULACAO_TEMPLATE)
+    except ValueError as e:
+        print(f"⚠️ Especulação desativada: {e}")
+        return False
+
+    payload = montar_payload(tpl, antena["lat"], antena["lon"], antena["altura"], "Network")
+    chave = _chave(payload)
+    caminho_tmp = os.path.join(ARQUIVOS_DIR, f"especulacao_{uuid.uuid4().hex}.png")
+
+    # 💰 A especulação nunca passa de ESPECULACAO_FRACAO_COTA da cota da janela, somando todos os workers
+    limite = int(CLOUDRF_COTA_JANELA * ESPECULACAO_FRACAO_COTA)
+    situacao = obter_store().iniciar_especulacao(chave, caminho_tmp, ESPECULACAO_TTL_S, CLOUDRF_JANELA_S, limite)
+    if situacao == "existente":
+        return True
+    if situacao == "sem_cota":
+        print("⚠️ Cota de simulações especulativas esgotada na janela atual")
+        return False
+
+    os.makedirs(ARQUIVOS_DIR, exist_ok=True)
+    tarefa = asyncio.get_running_loop().create_task(_executar(payload, caminho_tmp))
+    tarefa.add_done_callback(lambda t: _ao_terminar(chave, caminho_tmp, t))
+    _tarefas[chave] = tarefa
+    print(f"🔮 Simulação especulativa iniciada para {antena.get('nome') or 'antena'} ({tpl['id']})")
+    return True
+
+
+async def reivindicar_especulacao(payload: Dict[str, Any], caminho_imagem: str) -> Optional[List[float]]:
+    """
+    Se houver uma especulação para este payload (disparada por qualquer worker), espera
+    por ela se ainda estiver rodando, move a imagem para `caminho_imagem` e devolve os
+    bounds. None se não houver, se falhou ou se outra requisição ficou com o resultado.
+    """
+    _limpar_expiradas()
+    chave = _chave(payload)
+    store = obter_store()
+
+    tarefa = _tarefas.get(chave)
+    if tarefa is not None:
+        try:
+            # shield: se esta requisição for cancelada, a simulação continua para o próximo clique
+            await asyncio.shield(tarefa)
+        except asyncio.CancelledError:
+            if not tarefa.cancelled():
+                raise
+        except Exception:
+            pass # Já registrado (e descartado) em _ao_terminar
+
+    while True:
+        especulacao = store.obter_especulacao(chave)
+        if especulacao is None:
+            return None # Não há, falhou ou expirou
+        if especulacao["bounds"] is not None:
+            break
+        if time.time() - especulacao["iniciada_em"] > ESPERA_MAXIMA_S:
+            return None # O worker que a disparou provavelmente caiu
+        await asyncio.sleep(INTERVALO_CONSULTA_S)
+
+    reivindicada = store.reivindicar_especulacao(chave)
+    if reivindicada is None:
+        return None # Outra requisição idêntica já ficou com o resultado
+    caminho_tmp, bounds = reivindicada
+    os.replace(caminho_tmp, caminho_imagem)
+    print("🔮 Simulação especulativa aproveitada")
+    return bounds
+
+
+def encerrar_especulacoes() -> None:
+    # As tarefas deste worker morrem com ele; o que elas iam publicar é descartado
+    store = obter_store()
+    for chave, tarefa in list(_tarefas.items()):
+        tarefa.cancel()
+        especulacao = store.obter_especulacao(chave)
+        if especulacao is not None and especulacao["bounds"] is None:
+            store.descartar_especulacao(chave, especulacao["caminho_tmp"])
+            _remover_arquivo(especulacao["caminho_tmp"])
+    _tarefas.clear()
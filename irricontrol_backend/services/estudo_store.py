@@ -0,0 +1,460 @@
+import json
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from core.paths import ESTUDOS_DB_PATH
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS estudos (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    nome_arquivo TEXT,
+    criado_em TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS antenas (
+    estudo_id INTEGER PRIMARY KEY REFERENCES estudos(id) ON DELETE CASCADE,
+    nome TEXT,
+    lat REAL NOT NULL,
+    lon REAL NOT NULL,
+    altura INTEGER NOT NULL,
+    altura_receiver INTEGER
+);
+CREATE TABLE IF NOT EXISTS pivos (
+    estudo_id INTEGER NOT NULL REFERENCES estudos(id) ON DELETE CASCADE,
+    ordem INTEGER NOT NULL,
+    nome TEXT NOT NULL,
+    lat REAL NOT NULL,
+    lon REAL NOT NULL,
+    PRIMARY KEY (estudo_id, ordem)
+);
+CREATE TABLE IF NOT EXISTS ciclos (
+    estudo_id INTEGER NOT NULL REFERENCES estudos(id) ON DELETE CASCADE,
+    ordem INTEGER NOT NULL,
+    nome TEXT,
+    coordenadas TEXT NOT NULL,
+    PRIMARY KEY (estudo_id, ordem)
+);
+CREATE TABLE IF NOT EXISTS bombas (
+    estudo_id INTEGER NOT NULL REFERENCES estudos(id) ON DELETE CASCADE,
+    ordem INTEGER NOT NULL,
+    nome TEXT NOT NULL,
+    lat REAL NOT NULL,
+    lon REAL NOT NULL,
+    PRIMARY KEY (estudo_id, ordem)
+);
+CREATE TABLE IF NOT EXISTS simulacoes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    estudo_id INTEGER NOT NULL REFERENCES estudos(id) ON DELETE CASCADE,
+    tipo TEXT NOT NULL,
+    template TEXT NOT NULL,
+    lat REAL NOT NULL,
+    lon REAL NOT NULL,
+    altura INTEGER,
+    altura_receiver INTEGER,
+    criado_em TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_simulacoes_estudo_tipo ON simulacoes (estudo_id, tipo);
+CREATE TABLE IF NOT EXISTS artefatos (
+    nome_arquivo TEXT PRIMARY KEY,
+    simulacao_id INTEGER NOT NULL REFERENCES simulacoes(id) ON DELETE CASCADE,
+    bounds TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_artefatos_simulacao ON artefatos (simulacao_id);
+CREATE TABLE IF NOT EXISTS coberturas (
+    simulacao_id INTEGER NOT NULL REFERENCES simulacoes(id) ON DELETE CASCADE,
+    pivo_nome TEXT NOT NULL,
+    lat REAL NOT NULL,
+    lon REAL NOT NULL,
+    fora INTEGER NOT NULL,
+    PRIMARY KEY (simulacao_id, pivo_nome)
+);
+CREATE TABLE IF NOT EXISTS pivos_cobertura (
+    estudo_id INTEGER NOT NULL REFERENCES estudos(id) ON DELETE CASCADE,
+    ordem INTEGER NOT NULL,
+    nome TEXT NOT NULL,
+    lat REAL NOT NULL,
+    lon REAL NOT NULL,
+    PRIMARY KEY (estudo_id, ordem)
+);
+CREATE TABLE IF NOT EXISTS camadas (
+    nome_arquivo TEXT PRIMARY KEY REFERENCES artefatos(nome_arquivo) ON DELETE CASCADE,
+    estudo_id INTEGER NOT NULL REFERENCES estudos(id) ON DELETE CASCADE,
+    visivel INTEGER NOT NULL,
+    cobertos BLOB NOT NULL,
+    avaliados BLOB NOT NULL,
+    sinais BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_camadas_estudo ON camadas (estudo_id);
+CREATE TABLE IF NOT EXISTS chamadas_especulativas (
+    criado_em REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_chamadas_especulativas ON chamadas_especulativas (criado_em);
+CREATE TABLE IF NOT EXISTS especulacoes (
+    chave TEXT PRIMARY KEY,
+    caminho_tmp TEXT NOT NULL,
+    bounds TEXT,
+    iniciada_em REAL NOT NULL,
+    expira_em REAL NOT NULL
+);
+"""
+
+
+class EstudoStore:
+    """
+    Armazena estudos, fazendas parseadas, simulações, artefatos (PNGs e bounds)
+    e a cobertura de cada pivô por simulação em um SQLite local.
+
+    Também guarda o estado incremental de cobertura de cada estudo: a lista de
+    pivôs avaliada (`pivos_cobertura`, que pode divergir do KMZ quando o usuário
+    edita pivôs) e, por overlay (`camadas`), bitsets dos pivôs cobertos e já
+    avaliados, indexados pela ordem dessa lista.
+
+    As simulações especulativas também ficam aqui (instantes, para a cota, e o
+    resultado à espera do clique, com bounds NULL enquanto roda), para que
+    qualquer worker que use o mesmo banco respeite a cota e aproveite o resultado.
+
+    Abre uma conexão por operação, então pode ser usado de qualquer thread.
+    """
+
+    def __init__(self, caminho_db: str):
+        self.caminho_db = caminho_db
+        os.makedirs(os.path.dirname(os.path.abspath(caminho_db)), exist_ok=True)
+        with self._conectar() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _conectar(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.caminho_db, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA foreign_keys=ON")
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    # --- Estudos e fazendas ---
+
+    def criar_estudo(
+        self,
+        nome_arquivo: Optional[str],
+        antena: Dict[str, Any],
+        pivos: List[Dict[str, Any]],
+        ciclos: List[Dict[str, Any]],
+        bombas: List[Dict[str, Any]],
+    ) -> int:
+        with self._conectar() as conn:
+            estudo_id = conn.execute(
+                "INSERT INTO estudos (nome_arquivo, criado_em) VALUES (?, ?)",
+                (nome_arquivo, datetime.now().isoformat()),
+            ).lastrowid
+            conn.execute(
+                "INSERT INTO antenas (estudo_id, nome, lat, lon, altura, altura_receiver) VALUES (?, ?, ?, ?, ?, ?)",
+                (estudo_id, antena.get("nome"), antena["lat"], antena["lon"], antena["altura"], antena.get("altura_receiver")),
+            )
+            conn.executemany(
+                "INSERT INTO pivos (estudo_id, ordem, nome, lat, lon) VALUES (?, ?, ?, ?, ?)",
+                [(estudo_id, i, p["nome"], p["lat"], p["lon"]) for i, p in enumerate(pivos)],
+            )
+            conn.executemany(
+                "INSERT INTO ciclos (estudo_id, ordem, nome, coordenadas) VALUES (?, ?, ?, ?)",
+                [(estudo_id, i, c.get("nome"), json.dumps(c["coordenadas"])) for i, c in enumerate(ciclos)],
+            )
+            conn.executemany(
+                "INSERT INTO bombas (estudo_id, ordem, nome, lat, lon) VALUES (?, ?, ?, ?, ?)",
+                [(estudo_id, i, b["nome"], b["lat"], b["lon"]) for i, b in enumerate(bombas)],
+            )
+        return estudo_id
+
+    def obter_estudo_atual(self) -> Optional[int]:
+        # O estudo mais recente — equivalente ao antigo "entrada.kmz"
+        with self._conectar() as conn:
+            row = conn.execute("SELECT MAX(id) AS id FROM estudos").fetchone()
+        return row["id"]
+
+    def estudo_existe(self, estudo_id: int) -> bool:
+        with self._conectar() as conn:
+            return conn.execute("SELECT 1 FROM estudos WHERE id = ?", (estudo_id,)).fetchone() is not None
+
+    def remover_estudos_antigos(self, ttl_dias: float, max_estudos: int) -> List[str]:
+        """
+        Apaga os estudos sem atividade (criação ou última simulação) há mais de
+        `ttl_dias` e os que ficarem além dos `max_estudos` mais recentes; 0 desliga
+        cada limite. Devolve os arquivos dos artefatos apagados (para remover do disco).
+        """
+        with self._conectar() as conn:
+            ids = set()
+            if ttl_dias > 0:
+                limite = (datetime.now() - timedelta(days=ttl_dias)).isoformat()
+                ids.update(row["id"] for row in conn.execute(
+                    "SELECT e.id FROM estudos e LEFT JOIN simulacoes s ON s.estudo_id = e.id "
+                    "GROUP BY e.id HAVING MAX(COALESCE(s.criado_em, e.criado_em)) < ?", (limite,)
+                ))
+            if max_estudos > 0:
+                ids.update(row["id"] for row in conn.execute(
+                    "SELECT id FROM estudos ORDER BY id DESC LIMIT -1 OFFSET ?", (max_estudos,)
+                ))
+            if not ids:
+                return []
+
+            marcadores = ", ".join("?" * len(ids))
+            arquivos = [
+                row["nome_arquivo"] for row in conn.execute(
+                    "SELECT a.nome_arquivo FROM artefatos a JOIN simulacoes s ON s.id = a.simulacao_id "
+                    f"WHERE s.estudo_id IN ({marcadores})", list(ids)
+                )
+            ]
+            conn.execute(f"DELETE FROM estudos WHERE id IN ({marcadores})", list(ids))
+        print(f"🧹 {len(ids)} estudo(s) antigo(s) removido(s), {len(arquivos)} imagem(ns)")
+        return arquivos
+
+    def obter_fazenda(self, estudo_id: int) -> Optional[Tuple[Dict[str, Any], List[Dict[str, Any]], List[Dict[str, Any]], List[Dict[str, Any]]]]:
+        """
+        Devolve (antena, pivos, ciclos, bombas) no mesmo formato de `parse_kmz`,
+        ou None se o estudo não existir.
+        """
+        with self._conectar() as conn:
+            antena_row = conn.execute(
+                "SELECT nome, lat, lon, altura, altura_receiver FROM antenas WHERE estudo_id = ?", (estudo_id,)
+            ).fetchone()
+            if antena_row is None:
+                return None
+            pivos = conn.execute(
+                "SELECT nome, lat, lon FROM pivos WHERE estudo_id = ? ORDER BY ordem", (estudo_id,)
+            ).fetchall()
+            ciclos = conn.execute(
+                "SELECT nome, coordenadas FROM ciclos WHERE estudo_id = ? ORDER BY ordem", (estudo_id,)
+            ).fetchall()
+            bombas = conn.execute(
+                "SELECT nome, lat, lon FROM bombas WHERE estudo_id = ? ORDER BY ordem", (estudo_id,)
+            ).fetchall()
+
+        return (
+            dict(antena_row),
+            [dict(p) for p in pivos],
+            [{"nome": c["nome"], "coordenadas": json.loads(c["coordenadas"])} for c in ciclos],
+            [dict(b) for b in bombas],
+        )
+
+    # --- Simulações, artefatos e coberturas ---
+
+    def registrar_simulacao(
+        self,
+        estudo_id: int,
+        tipo: str,
+        template: str,
+        lat: float,
+        lon: float,
+        altura: Optional[int],
+        altura_receiver: Optional[int],
+        nome_arquivo: str,
+        bounds: List[float],
+        pivos_status: List[Dict[str, Any]],
+    ) -> int:
+        with self._conectar() as conn:
+            simulacao_id = conn.execute(
+                "INSERT INTO simulacoes (estudo_id, tipo, template, lat, lon, altura, altura_receiver, criado_em) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (estudo_id, tipo, template, lat, lon, altura, altura_receiver, datetime.now().isoformat()),
+            ).lastrowid
+            # Um novo resultado para o mesmo arquivo substitui o anterior
+            conn.execute("DELETE FROM artefatos WHERE nome_arquivo = ?", (nome_arquivo,))
+            conn.execute(
+                "INSERT INTO artefatos (nome_arquivo, simulacao_id, bounds) VALUES (?, ?, ?)",
+                (nome_arquivo, simulacao_id, json.dumps(bounds)),
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO coberturas (simulacao_id, pivo_nome, lat, lon, fora) VALUES (?, ?, ?, ?, ?)",
+                [(simulacao_id, p["nome"], p["lat"], p["lon"], int(bool(p["fora"]))) for p in pivos_status],
+            )
+        return simulacao_id
+
+    def remover_simulacoes(self, estudo_id: int) -> List[str]:
+        """
+        Remove todas as simulações do estudo e devolve os nomes dos arquivos
+        que deixaram de ser referenciados (para apagar do disco).
+        """
+        with self._conectar() as conn:
+            arquivos = [
+                row["nome_arquivo"] for row in conn.execute(
+                    "SELECT a.nome_arquivo FROM artefatos a JOIN simulacoes s ON s.id = a.simulacao_id "
+                    "WHERE s.estudo_id = ?", (estudo_id,)
+                )
+            ]
+            conn.execute("DELETE FROM simulacoes WHERE estudo_id = ?", (estudo_id,))
+        return arquivos
+
+    def listar_simulacoes(self, estudo_id: int, tipo: Optional[str] = None) -> List[Dict[str, Any]]:
+        sql = (
+            "SELECT s.id, s.tipo, s.template, s.lat, s.lon, s.altura, s.altura_receiver, a.nome_arquivo, a.bounds "
+            "FROM simulacoes s JOIN artefatos a ON a.simulacao_id = s.id WHERE s.estudo_id = ?"
+        )
+        params: List[Any] = [estudo_id]
+        if tipo is not None:
+            sql += " AND s.tipo = ?"
+            params.append(tipo)
+        sql += " ORDER BY s.id"
+
+        with self._conectar() as conn:
+            rows = conn.execute(sql, params).fetchall()
+        return [{**dict(row), "bounds": json.loads(row["bounds"])} for row in rows]
+
+    def obter_artefato(self, nome_arquivo: str) -> Optional[Dict[str, Any]]:
+        with self._conectar() as conn:
+            row = conn.execute(
+                "SELECT a.nome_arquivo, a.simulacao_id, a.bounds, s.estudo_id, s.tipo, s.template "
+                "FROM artefatos a JOIN simulacoes s ON s.id = a.simulacao_id WHERE a.nome_arquivo = ?",
+                (nome_arquivo,),
+            ).fetchone()
+        if row is None:
+            return None
+        return {**dict(row), "bounds": json.loads(row["bounds"])}
+
+    def obter_coberturas(self, simulacao_id: int) -> Dict[str, Dict[str, Any]]:
+        # nome do pivô -> {'lat', 'lon', 'fora'} como avaliado quando a simulação foi feita
+        with self._conectar() as conn:
+            rows = conn.execute(
+                "SELECT pivo_nome, lat, lon, fora FROM coberturas WHERE simulacao_id = ?", (simulacao_id,)
+            ).fetchall()
+        return {row["pivo_nome"]: {"lat": row["lat"], "lon": row["lon"], "fora": bool(row["fora"])} for row in rows}
+
+    # --- Estado incremental de cobertura ---
+
+    def obter_pivos_cobertura(self, estudo_id: int) -> List[Dict[str, Any]]:
+        # Enquanto os pivôs não forem editados, a lista é a do KMZ
+        with self._conectar() as conn:
+            rows = conn.execute(
+                "SELECT nome, lat, lon FROM pivos_cobertura WHERE estudo_id = ? ORDER BY ordem", (estudo_id,)
+            ).fetchall()
+            if not rows:
+                rows = conn.execute(
+                    "SELECT nome, lat, lon FROM pivos WHERE estudo_id = ? ORDER BY ordem", (estudo_id,)
+                ).fetchall()
+        return [dict(row) for row in rows]
+
+    def obter_camadas(self, estudo_id: int) -> Dict[str, Dict[str, Any]]:
+        # nome do arquivo -> camada, com simulacao_id, template e bounds do artefato
+        with self._conectar() as conn:
+            rows = conn.execute(
+                "SELECT c.nome_arquivo, c.visivel, c.cobertos, c.avaliados, c.sinais, "
+                "a.simulacao_id, a.bounds, s.template "
+                "FROM camadas c JOIN artefatos a ON a.nome_arquivo = c.nome_arquivo "
+                "JOIN simulacoes s ON s.id = a.simulacao_id WHERE c.estudo_id = ? ORDER BY s.id",
+                (estudo_id,),
+            ).fetchall()
+        return {
+            row["nome_arquivo"]: {**dict(row), "visivel": bool(row["visivel"]), "bounds": json.loads(row["bounds"])}
+            for row in rows
+        }
+
+    def aplicar_delta_cobertura(
+        self,
+        estudo_id: int,
+        pivos: Optional[List[Dict[str, Any]]],
+        remover: List[str],
+        camadas: List[Dict[str, Any]],
+    ) -> None:
+        """
+        Grava numa transação só o resultado de um delta: a nova lista de pivôs
+        (None se não mudou), as camadas removidas e as camadas alteradas. Os bitsets
+        são indexados pela ordem dos pivôs, então os dois nunca podem ser gravados
+        separados.
+        """
+        with self._conectar() as conn:
+            if pivos is not None:
+                conn.execute("DELETE FROM pivos_cobertura WHERE estudo_id = ?", (estudo_id,))
+                conn.executemany(
+                    "INSERT INTO pivos_cobertura (estudo_id, ordem, nome, lat, lon) VALUES (?, ?, ?, ?, ?)",
+                    [(estudo_id, i, p["nome"], p["lat"], p["lon"]) for i, p in enumerate(pivos)],
+                )
+            conn.executemany(
+                "DELETE FROM camadas WHERE estudo_id = ? AND nome_arquivo = ?",
+                [(estudo_id, nome) for nome in remover],
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO camadas (nome_arquivo, estudo_id, visivel, cobertos, avaliados, sinais) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (c["nome_arquivo"], estudo_id, int(c["visivel"]), c["cobertos"], c["avaliados"], c["sinais"])
+                    for c in camadas
+                ],
+            )
+
+    # --- Simulações especulativas ---
+
+    def iniciar_especulacao(self, chave: str, caminho_tmp: str, ttl_s: float, janela_s: float, limite: int) -> str:
+        """
+        Registra uma especulação para `chave` (hash do payload), consumindo uma das
+        `limite` chamadas especulativas dos últimos `janela_s` segundos.
+        Devolve "iniciada", "existente" (outro worker já especula esse payload)
+        ou "sem_cota". BEGIN IMMEDIATE serializa a decisão entre processos.
+        """
+        agora = time.time()
+        with self._conectar() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            if conn.execute(
+                "SELECT 1 FROM especulacoes WHERE chave = ? AND expira_em >= ?", (chave, agora)
+            ).fetchone() is not None:
+                return "existente"
+            conn.execute("DELETE FROM chamadas_especulativas WHERE criado_em < ?", (agora - janela_s,))
+            feitas = conn.execute("SELECT COUNT(*) AS n FROM chamadas_especulativas").fetchone()["n"]
+            if feitas + 1 > limite:
+                return "sem_cota"
+            conn.execute("INSERT INTO chamadas_especulativas (criado_em) VALUES (?)", (agora,))
+            conn.execute(
+                "INSERT OR REPLACE INTO especulacoes (chave, caminho_tmp, bounds, iniciada_em, expira_em) "
+                "VALUES (?, ?, NULL, ?, ?)",
+                (chave, caminho_tmp, agora, agora + ttl_s),
+            )
+        return "iniciada"
+
+    def concluir_especulacao(self, chave: str, caminho_tmp: str, bounds: List[float]) -> bool:
+        # False se a especulação já foi descartada (expirou); aí a imagem não tem dono
+        with self._conectar() as conn:
+            return conn.execute(
+                "UPDATE especulacoes SET bounds = ? WHERE chave = ? AND caminho_tmp = ?",
+                (json.dumps(bounds), chave, caminho_tmp),
+            ).rowcount > 0
+
+    def obter_especulacao(self, chave: str) -> Optional[Dict[str, Any]]:
+        with self._conectar() as conn:
+            row = conn.execute(
+                "SELECT caminho_tmp, bounds, iniciada_em FROM especulacoes WHERE chave = ? AND expira_em >= ?",
+                (chave, time.time()),
+            ).fetchone()
+        return dict(row) if row is not None else None
+
+    def reivindicar_especulacao(self, chave: str) -> Optional[Tuple[str, List[float]]]:
+        """
+        Fica com o resultado pronto de `chave`: (caminho da imagem, bounds), ou None
+        se não há resultado ou outra requisição, de qualquer worker, chegou antes.
+        """
+        with self._conectar() as conn:
+            row = conn.execute(
+                "DELETE FROM especulacoes WHERE chave = ? AND bounds IS NOT NULL AND expira_em >= ? "
+                "RETURNING caminho_tmp, bounds",
+                (chave, time.time()),
+            ).fetchone()
+        return (row["caminho_tmp"], json.loads(row["bounds"])) if row is not None else None
+
+    def descartar_especulacao(self, chave: str, caminho_tmp: str) -> None:
+        with self._conectar() as conn:
+            conn.execute("DELETE FROM especulacoes WHERE chave = ? AND caminho_tmp = ?", (chave, caminho_tmp))
+
+    def remover_especulacoes_expiradas(self) -> List[Tuple[str, str]]:
+        # (chave, caminho da imagem) das que expiraram sem ser reivindicadas
+        with self._conectar() as conn:
+            rows = conn.execute(
+                "DELETE FROM especulacoes WHERE expira_em < ? RETURNING chave, caminho_tmp", (time.time(),)
+            ).fetchall()
+        return [(row["chave"], row["caminho_tmp"]) for row in rows]
+
+@lru_cache(maxsize=1)
+def obter_store() -> EstudoStore:
+    return EstudoStore(ESTUDOS_DB_PATH)
@@ -0,0 +1,63 @@
+from typing import Any, Dict, List
+
+
+# Metros por grau de latitude (aproximação suficiente para a tolerância de simplificação)
+METROS_POR_GRAU = 111_320.0
+
+
+def simplificar_coordenadas(coords: List[List[float]], tolerancia_m: float) -> List[List[float]]:
+    """
+    Simplifica uma linha [lat, lon] (Douglas-Peucker do shapely) com tolerância em metros.
+    Mantém a linha original se a simplificação degenerar (menos de 3 pontos).
+    """
+    if tolerancia_m <= 0 or len(coords) < 3:
+        return coords
+
+    from shapely.geometry import LineString  # Import tardio (cold start)
+
+    linha = LineString([(lon, lat) for lat, lon in coords])
+    simplificada = linha.simplify(tolerancia_m / METROS_POR_GRAU, preserve_topology=False)
+    pontos = [[lat, lon] for lon, lat in simplificada.coords]
+    return pontos if len(pontos) >= 3 else coords
+
+
+def _codificar_valor(valor: int) -> str:
+    valor = ~(valor << 1) if valor < 0 else valor << 1
+    partes = []
+    while valor >= 0x20:
+        partes.append(chr((0x20 | (valor & 0x1F)) + 63))
+        valor >>= 5
+    partes.append(chr(valor + 63))
+    return "".join(partes)
+
+
+def codificar_polyline(coords: List[List[float]], precisao: int = 5) -> str:
+    """
+    Codifica [[lat, lon], ...] no formato "Encoded Polyline" do Google
+    (deltas inteiros em base64 de 5 bits); precisão 5 = ~1 m.
+    """
+    fator = 10 ** precisao
+    resultado = []
+    lat_anterior = lon_anterior = 0
+    for lat, lon in coords:
+        lat_int = int(round(lat * fator))
+        lon_int = int(round(lon * fator))
+        resultado.append(_codificar_valor(lat_int - lat_anterior))
+        resultado.append(_codificar_valor(lon_int - lon_anterior))
+        lat_anterior, lon_anterior = lat_int, lon_int
+    return "".join(resultado)
+
+
+def compactar_ciclos(ciclos: List[Dict[str, Any]], tolerancia_m: float = 0, formato: str = "coordenadas") -> List[Dict[str, Any]]:
+    """
+    Prepara os ciclos para resposta: simplifica com `tolerancia_m` e, no formato
+    "polyline", troca a lista 'coordenadas' por uma string 'polyline'.
+    """
+    compactados = []
+    for ciclo in ciclos:
+        coords = simplificar_coordenadas(ciclo["coordenadas"], tolerancia_m)
+        if formato == "polyline":
+            compactados.append({"nome": ciclo.get("nome"), "polyline": codificar_polyline(coords)})
+        else:
+            compactados.append({**ciclo, "coordenadas": coords})
+    return compactados
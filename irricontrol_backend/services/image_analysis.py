@@ -1,5 +1,5 @@
-from PIL import Image
-from typing import List, Dict, Any
+import os
+from typing import List, Dict, Any, Tuple
 
 
 def detectar_pivos_fora(
@@ -25,6 +25,8 @@ def detectar_pivos_fora(
         pivos_existentes_cobertos = []
 
     try:
+        from PIL import Image  # Import tardio (cold start)
+
         # 📥 Abre imagem e coleta dados
         img = Image.open(caminho_imagem).convert("RGBA")
         largura, altura = img.size
@@ -80,3 +82,36 @@ def detectar_pivos_fora(
     except Exception as e:
         print(f"❌ Erro processando {caminho_imagem}: {e}")
         return [{**p, "fora": True} for p in pivos]
+
+
+def reavaliar_cobertura(
+    pivos: List[Dict[str, Any]],
+    overlays: List[Tuple[List[float], str]]
+) -> Dict[str, bool]:
+    """
+    Combina a cobertura de vários overlays: um pivô está coberto se
+    estiver dentro de pelo menos um deles.
+
+    Args:
+        pivos: Lista de dicts {'nome', 'lat', 'lon'}.
+        overlays: Lista de (bounds, caminho_imagem), bounds já corrigidos.
+
+    Returns:
+        Dict nome do pivô -> True se coberto.
+    """
+    cobertura = {p["nome"]: False for p in pivos}
+
+    for bounds, caminho_imagem in overlays:
+        if not os.path.exists(caminho_imagem):
+            print(f"Aviso: Imagem para reavaliação não encontrada: {caminho_imagem}")
+            continue
+
+        pivos_para_checar = [p for p in pivos if not cobertura[p["nome"]]]
+        if not pivos_para_checar:
+            break
+
+        for p_status in detectar_pivos_fora(bounds, pivos_para_checar, caminho_imagem):
+            if not p_status["fora"]:
+                cobertura[p_status["nome"]] = True
+
+    return cobertura
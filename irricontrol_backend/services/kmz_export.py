@@ -0,0 +1,102 @@
+import os
+import zipfile
+from typing import List, Dict, Any, Optional
+
+
+def gerar_kmz_estudo(
+    antena: Dict[str, Any],
+    pivos: List[Dict[str, Any]],
+    ciclos: List[Dict[str, Any]],
+    caminho_kmz: str,
+    diretorio_imagens: str,
+    imagem_principal: Optional[str] = None,
+    bounds_principal: Optional[List[float]] = None,
+    repetidoras: Optional[List[Dict[str, Any]]] = None,
+) -> str:
+    """
+    Gera o KMZ do estudo de cobertura (antena, pivôs, círculos e overlays).
+
+    Args:
+        antena: Dict {'lat', 'lon', 'altura', 'nome'}.
+        pivos: Lista de dicts {'nome', 'lat', 'lon'} e, opcionalmente, 'fora'.
+        ciclos: Lista de dicts {'nome', 'coordenadas'} com [lat, lon].
+        caminho_kmz: Caminho do KMZ a ser gerado.
+        diretorio_imagens: Pasta onde estão os PNGs referenciados.
+        imagem_principal: Nome do PNG da antena principal (opcional).
+        bounds_principal: [sul, oeste, norte, leste] da imagem principal.
+        repetidoras: Lista de dicts {'imagem', 'bounds', 'nome'} e, opcionalmente,
+            'lat'/'lon' (se ausentes, usa o centro dos bounds).
+
+    Returns:
+        O próprio `caminho_kmz`.
+    """
+    import simplekml  # Import tardio (cold start)
+
+    kml = simplekml.Kml(name="Estudo de Cobertura Irricontrol")
+
+    torre_style = simplekml.Style()
+    torre_style.iconstyle.icon.href = "http://maps.google.com/mapfiles/kml/paddle/T.png"
+    torre_style.iconstyle.scale = 1.2
+
+    pnt_torre = kml.newpoint(name=antena.get("nome", "Antena Principal"),
+                             coords=[(antena["lon"], antena["lat"])])
+    pnt_torre.description = f"Altura: {antena['altura']}m"
+    pnt_torre.style = torre_style
+
+    for p in pivos:
+        pnt_pivo = kml.newpoint(name=p["nome"], coords=[(p["lon"], p["lat"])])
+        if p.get("fora") is None:
+            pnt_pivo.description = "Status de cobertura a ser verificado"
+        else:
+            pnt_pivo.description = "Fora da cobertura" if p["fora"] else "Coberto"
+        pnt_pivo.style = torre_style # Reutiliza estilo da torre, pode querer um diferente para pivos
+
+    for ciclo in ciclos:
+        if ciclo.get("coordenadas"):
+            poly = kml.newpolygon(name=ciclo.get("nome", "Área Pivô"))
+            poly.outerboundaryis = [(lon, lat) for lat, lon in ciclo["coordenadas"]]
+            poly.style.polystyle.color = simplekml.Color.changealphaint(100, simplekml.Color.yellow)
+            poly.style.linestyle.color = simplekml.Color.red
+            poly.style.linestyle.width = 2
+
+    imagens_embebidas_kmz = set()
+
+    if imagem_principal and bounds_principal and os.path.exists(os.path.join(diretorio_imagens, imagem_principal)):
+        ground = kml.newgroundoverlay(name=f"Cobertura: {antena.get('nome', 'Principal')}")
+        ground.icon.href = imagem_principal
+        ground.latlonbox.north, ground.latlonbox.south = bounds_principal[2], bounds_principal[0]
+        ground.latlonbox.east, ground.latlonbox.west = bounds_principal[3], bounds_principal[1]
+        ground.color = simplekml.Color.changealphaint(180, simplekml.Color.white)
+        imagens_embebidas_kmz.add(imagem_principal)
+
+    if os.path.exists(os.path.join(diretorio_imagens, "cloudrf.png")):
+        imagens_embebidas_kmz.add("cloudrf.png")
+
+    for rep in repetidoras or []:
+        bounds_rep = rep["bounds"]
+        ground_rep = kml.newgroundoverlay(name=f"Cobertura Repetidora: {rep['imagem']}")
+        ground_rep.icon.href = rep["imagem"]
+        ground_rep.latlonbox.north, ground_rep.latlonbox.south = bounds_rep[2], bounds_rep[0]
+        ground_rep.latlonbox.east, ground_rep.latlonbox.west = bounds_rep[3], bounds_rep[1]
+        ground_rep.color = simplekml.Color.changealphaint(150, simplekml.Color.white)
+        imagens_embebidas_kmz.add(rep["imagem"])
+
+        lat_rep = rep.get("lat")
+        lon_rep = rep.get("lon")
+        if lat_rep is None or lon_rep is None: # fallback se não há coords
+            lat_rep = (bounds_rep[0] + bounds_rep[2]) / 2
+            lon_rep = (bounds_rep[1] + bounds_rep[3]) / 2
+        pnt_rep = kml.newpoint(name=f"Repetidora ({rep.get('nome', '')})", coords=[(lon_rep, lat_rep)])
+        pnt_rep.style = torre_style
+
+    with zipfile.ZipFile(caminho_kmz, 'w', zipfile.ZIP_DEFLATED) as kmz_zip:
+        kmz_zip.writestr("estudo_irricontrol.kml", kml.kml())
+
+        for img_nome_relativo in imagens_embebidas_kmz:
+            caminho_img_abs = os.path.join(diretorio_imagens, img_nome_relativo)
+            if os.path.exists(caminho_img_abs):
+                kmz_zip.write(caminho_img_abs, img_nome_relativo)
+            else:
+                print(f"Aviso: Imagem {img_nome_relativo} não encontrada para adicionar ao KMZ.")
+
+    return caminho_kmz
@@ -0,0 +1,148 @@
+import asyncio
+import io
+import os
+import tempfile
+import zipfile
+from typing import TYPE_CHECKING, AsyncIterator, Dict, Any, List, Optional, Tuple
+
+from core.config import KMZ_LOTE_WORKERS, KMZ_LOTE_MAX_ARQUIVOS, KMZ_LOTE_MAX_ARQUIVO_MB, KMZ_LOTE_MAX_TOTAL_MB
+from services.kmz_parser import parse_kmz
+
+
+if TYPE_CHECKING:
+    from concurrent.futures import ProcessPoolExecutor
+
+ArquivoLote = Tuple[str, bytes]  # (nome do arquivo, conteúdo)
+
+EXTENSOES_ACEITAS = (".kmz", ".kml")
+
+_executor: Optional["ProcessPoolExecutor"] = None
+
+
+class LoteMuitoGrandeError(Exception):
+    # O lote passou de um dos limites KMZ_LOTE_MAX_* (vira HTTP 413)
+    pass
+
+
+def _obter_executor() -> "ProcessPoolExecutor":
+    # 🏭 Pool criado sob demanda e reaproveitado entre requisições
+    global _executor
+    if _executor is None:
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        # "spawn" e não fork: a API tem threads (aquecimento, threadpool) e um fork
+        # no meio de um import herdaria o lock travado e congelaria o worker
+        _executor = ProcessPoolExecutor(max_workers=KMZ_LOTE_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _executor
+
+
+def encerrar_executor() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def expandir_arquivos(arquivos: List[ArquivoLote]) -> List[ArquivoLote]:
+    """
+    Abre os .zip enviados e devolve a lista plana de KMZ/KML a processar.
+    Arquivos com outras extensões são ignorados.
+
+    Os tamanhos declarados no ZIP são conferidos com os limites KMZ_LOTE_MAX_*
+    antes de descompactar qualquer coisa (a leitura também nunca passa do
+    tamanho declarado). Levanta LoteMuitoGrandeError se algum limite estourar.
+    """
+    limite_arquivo = int(KMZ_LOTE_MAX_ARQUIVO_MB * 1024 * 1024)
+    limite_total = int(KMZ_LOTE_MAX_TOTAL_MB * 1024 * 1024)
+    quantidade = total = 0
+    expandidos = []
+
+    def conferir_limites(nome: str, tamanho: int) -> None:
+        nonlocal quantidade, total
+        quantidade += 1
+        total += tamanho
+        if quantidade > KMZ_LOTE_MAX_ARQUIVOS:
+            raise LoteMuitoGrandeError(f"O lote tem mais de {KMZ_LOTE_MAX_ARQUIVOS} arquivos KMZ/KML.")
+        if tamanho > limite_arquivo:
+            raise LoteMuitoGrandeError(f"{nome} passa do limite de {KMZ_LOTE_MAX_ARQUIVO_MB:g} MB por arquivo.")
+        if total > limite_total:
+            raise LoteMuitoGrandeError(f"O lote passa do limite de {KMZ_LOTE_MAX_TOTAL_MB:g} MB descompactado.")
+
+    for nome, conteudo in arquivos:
+        nome_lower = nome.lower()
+        if nome_lower.endswith(".zip"):
+            with zipfile.ZipFile(io.BytesIO(conteudo), "r") as zip_lote:
+                membros = [
+                    info for info in zip_lote.infolist()
+                    if not info.is_dir() and info.filename.lower().endswith(EXTENSOES_ACEITAS)
+                    and not info.filename.startswith("__MACOSX/")
+                ]
+                for info in membros:
+                    conferir_limites(info.filename, info.file_size)
+                for info in membros:
+                    with zip_lote.open(info) as membro:
+                        expandidos.append((info.filename, membro.read(info.file_size)))
+        elif nome_lower.endswith(EXTENSOES_ACEITAS):
+            conferir_limites(nome, len(conteudo))
+            expandidos.append((nome, conteudo))
+        else:
+            print(f"Aviso: Arquivo ignorado no lote (extensão não suportada): {nome}")
+    return expandidos
+
+
+def _processar_arquivo(nome: str, conteudo: bytes) -> Dict[str, Any]:
+    # ⚙️ Roda dentro de um processo do pool: grava em arquivo temporário próprio e faz o parse
+    sufixo = os.path.splitext(nome)[1].lower() or ".kmz"
+    with tempfile.NamedTemporaryFile(suffix=sufixo, delete=False) as tmp:
+        tmp.write(conteudo)
+        caminho_tmp = tmp.name
+
+    try:
+        antena, pivos, ciclos, bombas = parse_kmz(caminho_tmp)
+    except Exception as e:
+        return {"arquivo": nome, "status": "erro", "erro": f"Erro ao processar KMZ: {str(e)}"}
+    finally:
+        os.remove(caminho_tmp)
+
+    if not antena:
+        return {"arquivo": nome, "status": "erro", "erro": "Antena não encontrada no KMZ"}
+
+    return {"arquivo": nome, "status": "ok", "antena": antena, "pivos": pivos, "ciclos": ciclos, "bombas": bombas}
+
+
+def _descartar_executor(executor: "ProcessPoolExecutor") -> None:
+    # Só zera o global se ele ainda for o pool quebrado (outra tarefa pode já ter criado um novo)
+    global _executor
+    if _executor is executor:
+        _executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+async def _processar_no_pool(nome: str, conteudo: bytes) -> Dict[str, Any]:
+    from concurrent.futures.process import BrokenProcessPool
+
+    loop = asyncio.get_running_loop()
+    for tentativa in range(2):
+        executor = _obter_executor()
+        try:
+            return await loop.run_in_executor(executor, _processar_arquivo, nome, conteudo)
+        except BrokenProcessPool as e:
+            # Um worker morreu (OOM, kill) e o pool não se recupera sozinho: descarta, recria e tenta mais uma vez
+            print(f"⚠️ Pool de processos quebrado ao processar {nome} (tentativa {tentativa + 1}): {e}")
+            _descartar_executor(executor)
+            erro = e
+        except Exception as e:
+            # Falha do próprio pool não derruba o lote
+            erro = e
+            break
+    return {"arquivo": nome, "status": "erro", "erro": f"Falha no processamento: {str(erro)}"}
+
+
+async def processar_lote(arquivos: List[ArquivoLote]) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Faz o parse dos arquivos em paralelo no pool de processos e entrega
+    cada resultado assim que fica pronto (ordem de conclusão, não de envio).
+    """
+    tarefas = [_processar_no_pool(nome, conteudo) for nome, conteudo in arquivos]
+    for tarefa in asyncio.as_completed(tarefas):
+        yield await tarefa
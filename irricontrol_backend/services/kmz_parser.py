@@ -1,8 +1,6 @@
-import os
 import zipfile
 import xml.etree.ElementTree as ET
 from statistics import mean
-from shapely.geometry import Polygon
 from math import sqrt
 from typing import List, Tuple, Dict, Any, Optional
 from utils.file_helpers import normalizar_nome
@@ -15,70 +13,65 @@ CicloDict = Dict[str, Any]
 BombaDict = Dict[str, Any]
 
 
+def _ler_kmls(caminho_kmz: str) -> List[bytes]:
+    # 📦 Lê os KMLs direto do zip, em memória (sem extrair para disco), para que
+    # vários parses possam rodar em paralelo sem disputar a mesma pasta temporária.
+    # Aceita também um .kml solto.
+    if not zipfile.is_zipfile(caminho_kmz):
+        with open(caminho_kmz, "rb") as f:
+            return [f.read()]
+
+    with zipfile.ZipFile(caminho_kmz, 'r') as kmz_file:
+        return [kmz_file.read(nome) for nome in kmz_file.namelist() if nome.lower().endswith('.kml')]
+
+
 def parse_kmz(caminho_kmz: str) -> Tuple[Optional[AntenaDict], List[PivoDict], List[CicloDict], List[BombaDict]]:
     antena = None
     pivos = []
     ciclos = []
     bombas = []
 
-    os.makedirs("arquivos", exist_ok=True)
+    for conteudo_kml in _ler_kmls(caminho_kmz):
+        root = ET.fromstring(conteudo_kml)
+        ns = {"kml": "http://www.opengis.net/kml/2.2"}
 
-    with zipfile.ZipFile(caminho_kmz, 'r') as kmz_file:
-        for nome_arquivo_interno in kmz_file.namelist():
-            if nome_arquivo_interno.endswith('.kml'):
-                extract_path = os.path.join("arquivos", "temp_kml_extract")
-                os.makedirs(extract_path, exist_ok=True)
-                kmz_file.extract(nome_arquivo_interno, extract_path)
-                caminho_kml_extraido = os.path.join(extract_path, nome_arquivo_interno)
-
-                tree = ET.parse(caminho_kml_extraido)
-                root = tree.getroot()
-                ns = {"kml": "http://www.opengis.net/kml/2.2"}
-
-                for placemark in root.findall(".//kml:Placemark", ns):
-                    nome_element = placemark.find("kml:name", ns)
-                    ponto_element = placemark.find(".//kml:Point/kml:coordinates", ns)
-                    linha_element = placemark.find(".//kml:LineString/kml:coordinates", ns)
-
-                    nome_texto = (nome_element.text or "").strip()
-                    nome_lower = nome_texto.lower()
-
-                    if ponto_element is not None:
-                        coords = list(map(float, ponto_element.text.strip().split(",")))
-                        lon, lat = coords[0], coords[1]
-
-                        if any(x in nome_lower for x in ["antena", "torre", "barracão", "galpão", "silo", "caixa", "repetidora"]):
-                            altura = 15
-                            altura_match = re.search(r"(\d{1,3})\s*(m|metros)", nome_lower)
-                            if altura_match:
-                                altura = int(altura_match.group(1))
-
-                            antena = {"lat": lat, "lon": lon, "altura": altura, "altura_receiver": 3, "nome": nome_texto}
-
-                        elif "pivô" in nome_lower or re.match(r"p\s?\d+", nome_lower):
-                            nome_norm = normalizar_nome(nome_texto)
-                            if not any(normalizar_nome(p["nome"]) == nome_norm for p in pivos):
-                                pivos.append({"nome": nome_texto, "lat": lat, "lon": lon})
-
-                        elif "casa de bomba" in nome_lower or "irripump" in nome_lower:
-                            bombas.append({"nome": nome_texto, "lat": lat, "lon": lon})
-
-                    if linha_element is not None and "medida do círculo" in nome_lower:
-                        coords_list = []
-                        for coord_str in linha_element.text.strip().split():
-                            parts = coord_str.split(",")
-                            if len(parts) >= 2:
-                                coords_list.append([float(parts[1]), float(parts[0])]) # lat, lon
-
-                        if coords_list:
-                            ciclos.append({"nome": nome_texto, "coordenadas": coords_list})
-
-                try:
-                    os.remove(caminho_kml_extraido)
-                    if not os.listdir(extract_path):
-                        os.rmdir(extract_path)
-                except Exception as e:
-                    print(f"Aviso ao limpar arquivos temporários: {e}")
+        for placemark in root.findall(".//kml:Placemark", ns):
+            nome_element = placemark.find("kml:name", ns)
+            ponto_element = placemark.find(".//kml:Point/kml:coordinates", ns)
+            linha_element = placemark.find(".//kml:LineString/kml:coordinates", ns)
+
+            nome_texto = (nome_element.text or "").strip()
+            nome_lower = nome_texto.lower()
+
+            if ponto_element is not None:
+                coords = list(map(float, ponto_element.text.strip().split(",")))
+                lon, lat = coords[0], coords[1]
+
+                if any(x in nome_lower for x in ["antena", "torre", "barracão", "galpão", "silo", "caixa", "repetidora"]):
+                    altura = 15
+                    altura_match = re.search(r"(\d{1,3})\s*(m|metros)", nome_lower)
+                    if altura_match:
+                        altura = int(altura_match.group(1))
+
+                    antena = {"lat": lat, "lon": lon, "altura": altura, "altura_receiver": 3, "nome": nome_texto}
+
+                elif "pivô" in nome_lower or re.match(r"p\s?\d+", nome_lower):
+                    nome_norm = normalizar_nome(nome_texto)
+                    if not any(normalizar_nome(p["nome"]) == nome_norm for p in pivos):
+                        pivos.append({"nome": nome_texto, "lat": lat, "lon": lon})
+
+                elif "casa de bomba" in nome_lower or "irripump" in nome_lower:
+                    bombas.append({"nome": nome_texto, "lat": lat, "lon": lon})
+
+            if linha_element is not None and "medida do círculo" in nome_lower:
+                coords_list = []
+                for coord_str in linha_element.text.strip().split():
+                    parts = coord_str.split(",")
+                    if len(parts) >= 2:
+                        coords_list.append([float(parts[1]), float(parts[0])]) # lat, lon
+
+                if coords_list:
+                    ciclos.append({"nome": nome_texto, "coordenadas": coords_list})
 
     # 🧠 Gera pivôs com nome automático se não tiver placemark
     nomes_existentes = {normalizar_nome(p["nome"]) for p in pivos}
@@ -90,6 +83,7 @@ def parse_kmz(caminho_kmz: str) -> Tuple[Optional[AntenaDict], List[PivoDict], L
             continue
 
         try:
+            from shapely.geometry import Polygon  # Import tardio: shapely/numpy pesam no cold start
             polygon = Polygon([(lon, lat) for lat, lon in coords])
             centroide = polygon.centroid
             lat_centro, lon_centro = centroide.y, centroide.x
@@ -0,0 +1,128 @@
+import sys
+import threading
+import time
+from types import FrameType
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+class AmostradorPilhas:
+    """
+    Profiler de amostragem: uma thread lê a pilha de todas as threads do
+    processo (`sys._current_frames`) a cada `intervalo` segundos.
+
+    Ao contrário de um profiler preso à thread que o iniciou, vê também os
+    endpoints síncronos e o `asyncio.to_thread`, que rodam no threadpool.
+    Só guarda amostras que passam pelo código em `diretorio_raiz`, o que
+    descarta threads ociosas (loop esperando I/O, workers parados).
+
+    Na thread que chama `iniciar` (a do loop), só conta as amostras cuja pilha
+    passa por `frame_raiz`, ou seja, a tarefa da requisição perfilada e não as
+    outras que o loop intercala. As demais threads não dizem de quem é o
+    trabalho, então só são amostradas enquanto `exclusiva()` for verdadeiro;
+    as amostras puladas ficam em `descartadas`.
+    """
+
+    def __init__(
+        self,
+        intervalo: float,
+        diretorio_raiz: str,
+        frame_raiz: Optional[FrameType] = None,
+        exclusiva: Callable[[], bool] = lambda: True,
+    ):
+        self.intervalo = intervalo
+        self.diretorio_raiz = diretorio_raiz
+        self.frame_raiz = frame_raiz
+        self.exclusiva = exclusiva
+        self.descartadas = 0
+        self._frames: List[Dict[str, Any]] = []
+        self._indices: Dict[Tuple[str, str, int], int] = {}
+        # id da thread -> (amostras: pilhas de índices raiz -> topo, pesos em segundos)
+        self._amostras: Dict[int, Tuple[List[List[int]], List[float]]] = {}
+        self._nomes_threads: Dict[int, str] = {}
+        self._parar = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.duracao = 0.0
+
+    def iniciar(self) -> None:
+        self._thread_loop = threading.get_ident()
+        self._inicio = time.perf_counter()
+        self._thread = threading.Thread(target=self._rodar, name="amostrador-perfil", daemon=True)
+        self._thread.start()
+
+    def parar(self) -> None:
+        self._parar.set()
+        self._thread.join()
+        self.duracao = time.perf_counter() - self._inicio
+
+    def _eh_do_backend(self, arquivo: str) -> bool:
+        return arquivo.startswith(self.diretorio_raiz) and "site-packages" not in arquivo
+
+    def _indice_frame(self, code) -> int:
+        chave = (getattr(code, "co_qualname", code.co_name), code.co_filename, code.co_firstlineno)
+        indice = self._indices.get(chave)
+        if indice is None:
+            indice = self._indices[chave] = len(self._frames)
+            self._frames.append({"name": chave[0], "file": chave[1], "line": chave[2]})
+        return indice
+
+    def _rodar(self) -> None:
+        proprio = threading.get_ident()
+        anterior = time.perf_counter()
+        while not self._parar.wait(self.intervalo):
+            agora = time.perf_counter()
+            peso, anterior = agora - anterior, agora
+
+            exclusiva = self.exclusiva()
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == proprio:
+                    continue
+                codes = []
+                do_backend = False
+                da_requisicao = self.frame_raiz is None
+                while frame is not None:
+                    codes.append(frame.f_code)
+                    do_backend = do_backend or self._eh_do_backend(frame.f_code.co_filename)
+                    da_requisicao = da_requisicao or frame is self.frame_raiz
+                    frame = frame.f_back
+                if not do_backend:
+                    continue
+                if thread_id == self._thread_loop:
+                    if not da_requisicao:
+                        continue
+                elif not exclusiva:
+                    self.descartadas += 1
+                    continue
+
+                if thread_id not in self._amostras:
+                    self._amostras[thread_id] = ([], [])
+                    self._nomes_threads[thread_id] = next(
+                        (t.name for t in threading.enumerate() if t.ident == thread_id), str(thread_id)
+                    )
+                amostras, pesos = self._amostras[thread_id]
+                amostras.append([self._indice_frame(code) for code in reversed(codes)])
+                pesos.append(peso)
+
+    def para_speedscope(self, nome: str, metadados: Dict[str, Any]) -> Dict[str, Any]:
+        # Formato em https://www.speedscope.app/file-format-schema.json (um perfil por thread)
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": nome,
+            "exporter": "irricontrol-backend",
+            "activeProfileIndex": 0,
+            "irricontrol": metadados,
+            "shared": {"frames": self._frames},
+            "profiles": [
+                {
+                    "type": "sampled",
+                    "name": self._nomes_threads[thread_id],
+                    "unit": "seconds",
+                    "startValue": 0,
+                    "endValue": sum(pesos),
+                    "samples": amostras,
+                    "weights": pesos,
+                }
+                for thread_id, (amostras, pesos) in sorted(
+                    self._amostras.items(), key=lambda item: sum(item[1][1]), reverse=True
+                )
+            ],
+        }
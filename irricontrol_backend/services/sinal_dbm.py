@@ -0,0 +1,124 @@
+import os
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+from core.config import PALETAS_DBM
+
+if TYPE_CHECKING:
+    import numpy as np
+
+
+# Valor da grade para pixels sem cobertura (transparentes)
+SEM_SINAL = -128
+
+Paleta = Dict[Tuple[int, int, int], int]
+
+
+def caminho_grade(caminho_imagem: str) -> str:
+    # A grade fica ao lado do PNG: sinal_x.png -> sinal_x.dbm.npy
+    return f"{os.path.splitext(caminho_imagem)[0]}.dbm.npy"
+
+
+def decodificar_imagem(caminho_imagem: str, paleta: Paleta) -> "np.ndarray":
+    """
+    Converte o PNG de cobertura da CloudRF numa grade de dBm (int8, uma célula por pixel).
+
+    Cada cor distinta da imagem é mapeada uma única vez para a cor mais próxima da
+    paleta (tabela de consulta), e a grade inteira é montada por indexação vetorizada.
+    Pixels transparentes recebem SEM_SINAL.
+    """
+    import numpy as np
+    from PIL import Image
+
+    rgba = np.asarray(Image.open(caminho_imagem).convert("RGBA"))
+    rgb = rgba[..., :3].astype(np.int32)
+    codigos = (rgb[..., 0] << 16) | (rgb[..., 1] << 8) | rgb[..., 2]
+
+    cores_unicas, indices = np.unique(codigos, return_inverse=True)
+    cores_paleta = np.array(list(paleta.keys()), dtype=np.int32)
+    valores_paleta = np.array(list(paleta.values()), dtype=np.int8)
+
+    componentes = np.stack([(cores_unicas >> 16) & 0xFF, (cores_unicas >> 8) & 0xFF, cores_unicas & 0xFF], axis=1)
+    distancias = ((componentes[:, None, :] - cores_paleta[None, :, :]) ** 2).sum(axis=2)
+    tabela = valores_paleta[distancias.argmin(axis=1)]
+
+    grade = tabela[indices.reshape(codigos.shape)]
+    grade[rgba[..., 3] == 0] = SEM_SINAL
+    return grade
+
+
+@lru_cache(maxsize=64)
+def _abrir_grade(caminho: str, mtime_ns: int) -> "np.ndarray":
+    import numpy as np
+    return np.load(caminho, mmap_mode="r")
+
+
+def obter_grade(caminho_imagem: str, col: str) -> Optional["np.ndarray"]:
+    """
+    Devolve a grade de dBm memory-mapped da imagem, decodificando e salvando o .npy
+    só na primeira vez. None se a escala de cor `col` não for conhecida ou a imagem não
+    existir ou não puder ser lida; aí o resultado fica só em dentro/fora, como em
+    `detectar_pivos_fora`.
+    """
+    import numpy as np
+
+    paleta = PALETAS_DBM.get(col)
+    if paleta is None or not os.path.exists(caminho_imagem):
+        return None
+
+    caminho = caminho_grade(caminho_imagem)
+    try:
+        if not os.path.exists(caminho) or os.path.getmtime(caminho) < os.path.getmtime(caminho_imagem):
+            grade = decodificar_imagem(caminho_imagem, paleta)
+            caminho_tmp = f"{caminho}.tmp.npy"
+            np.save(caminho_tmp, grade)
+            os.replace(caminho_tmp, caminho)
+            print(f"🎨 Grade de dBm salva em {caminho}")
+
+        return _abrir_grade(caminho, os.stat(caminho).st_mtime_ns)
+    except Exception as e:
+        print(f"❌ Erro lendo dBm de {caminho_imagem}: {e}")
+        return None
+
+
+def remover_grade(caminho_imagem: str) -> None:
+    caminho = caminho_grade(caminho_imagem)
+    if os.path.exists(caminho):
+        os.remove(caminho)
+
+
+def remover_imagens(nomes_arquivo: List[str], diretorio: str) -> None:
+    # Apaga PNGs de simulação que deixaram de ser referenciados, junto com as grades de dBm
+    for nome in nomes_arquivo:
+        caminho_imagem = os.path.join(diretorio, nome)
+        try:
+            if os.path.exists(caminho_imagem):
+                os.remove(caminho_imagem)
+            remover_grade(caminho_imagem)
+        except OSError as e:
+            print(f"Aviso: Não foi possível remover arquivo antigo {nome}: {e}")
+
+
+def amostrar_pivos(bounds: List[float], pivos: List[Dict[str, Any]], grade: "np.ndarray") -> List[Optional[int]]:
+    """
+    Lê o nível de sinal (dBm) no pixel de cada pivô, com a mesma conversão
+    lat/lon -> pixel de `detectar_pivos_fora`. None se o pivô está fora da imagem ou sem sinal.
+    """
+    altura, largura = grade.shape
+    sul, oeste, norte, leste = bounds
+    if oeste > leste:
+        oeste, leste = leste, oeste
+    if sul > norte:
+        sul, norte = norte, sul
+    if leste == oeste or norte == sul:
+        return [None for _ in pivos]
+
+    niveis = []
+    for p in pivos:
+        x = int(((p["lon"] - oeste) / (leste - oeste)) * largura)
+        y = int(((norte - p["lat"]) / (norte - sul)) * altura)
+        if 0 <= x < largura and 0 <= y < altura and grade[y, x] != SEM_SINAL:
+            niveis.append(int(grade[y, x]))
+        else:
+            niveis.append(None)
+    return niveis
@@ -0,0 +1,58 @@
+import asyncio
+
+import pytest
+
+from api.routers import simulation
+from models.simulation import AtualizarCoberturaRequest
+from services.estudo_store import EstudoStore
+
+P1 = {"nome": "P1", "lat": -15.0, "lon": -47.0}
+P2 = {"nome": "P2", "lat": -15.01, "lon": -47.01}
+BOUNDS = [-15.05, -47.05, -14.95, -46.95]
+
+
+@pytest.fixture
+def estudo(tmp_path, monkeypatch):
+    # Sem PNG no disco: a cobertura vem do que a simulação registrou e a grade de dBm fica None
+    monkeypatch.setattr(simulation, "STATIC_IMAGENS_DIR", str(tmp_path))
+    store = EstudoStore(str(tmp_path / "estudos.db"))
+    estudo_id = store.criar_estudo("f.kmz", {"lat": -15.0, "lon": -47.0, "altura": 15}, [P1, P2], [], [])
+    store.registrar_simulacao(
+        estudo_id, "principal", "Brazil_V6", -15.0, -47.0, 15, 3, "a.png", BOUNDS,
+        [{**P1, "fora": True}, {**P2, "fora": False}],
+    )
+    store.registrar_simulacao(
+        estudo_id, "repetidora", "Brazil_V6", -15.0, -47.0, 5, 3, "b.png", BOUNDS,
+        [{**P1, "fora": True}, {**P2, "fora": True}],
+    )
+    return store, estudo_id
+
+
+def _atualizar(store, estudo_id, **delta):
+    request = AtualizarCoberturaRequest(estudo_id=estudo_id, **delta)
+    resposta = asyncio.run(simulation.atualizar_cobertura_endpoint(request, store=store))
+    return [(p.nome, p.fora) for p in resposta.pivos]
+
+
+def test_falha_no_meio_do_delta_nao_grava_nada(estudo, monkeypatch):
+    store, estudo_id = estudo
+    assert _atualizar(store, estudo_id, adicionar=["a.png"]) == [("P1", True), ("P2", False)]
+
+    def falhar(*args, **kwargs):
+        raise RuntimeError("imagem ilegível")
+
+    monkeypatch.setattr(simulation, "avaliar_pendentes", falhar)
+    with pytest.raises(RuntimeError):
+        _atualizar(store, estudo_id, pivos=[P2, P1], adicionar=["b.png"], remover=["a.png"])
+    monkeypatch.undo()
+
+    assert _atualizar(store, estudo_id) == [("P1", True), ("P2", False)]
+    assert [p["nome"] for p in store.obter_pivos_cobertura(estudo_id)] == ["P1", "P2"]
+    assert list(store.obter_camadas(estudo_id)) == ["a.png"]
+
+
+def test_pivos_reordenados_mantem_cobertura(estudo):
+    store, estudo_id = estudo
+    _atualizar(store, estudo_id, adicionar=["a.png"])
+    assert _atualizar(store, estudo_id, pivos=[P2, P1]) == [("P2", False), ("P1", True)]
+    assert _atualizar(store, estudo_id) == [("P2", False), ("P1", True)]
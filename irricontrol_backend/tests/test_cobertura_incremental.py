@@ -0,0 +1,70 @@
+from array import array
+
+from services.cobertura_incremental import combinar_camadas, mapear_pivos, remapear_camada
+from services.sinal_dbm import SEM_SINAL
+
+
+def _pivo(nome, lat, lon):
+    return {"nome": nome, "lat": lat, "lon": lon}
+
+
+def _camada(cobertos, avaliados, sinais, visivel=True, template="Brazil_V6"):
+    return {
+        "visivel": visivel,
+        "template": template,
+        "cobertos": cobertos,
+        "avaliados": avaliados,
+        "sinais": array("b", sinais),
+    }
+
+
+def test_mapear_pivos_acompanha_reordenacao():
+    antigos = [_pivo("P1", -15.0, -47.0), _pivo("P2", -15.1, -47.1), _pivo("P3", -15.2, -47.2)]
+    novos = [antigos[2], antigos[0], antigos[1]]
+    assert mapear_pivos(antigos, novos) == [2, 0, 1]
+
+
+def test_mapear_pivos_marca_novos_e_movidos():
+    antigos = [_pivo("P1", -15.0, -47.0), _pivo("P2", -15.1, -47.1)]
+    novos = [_pivo("P1", -15.0, -47.0), _pivo("P2", -15.1005, -47.1), _pivo("P9", -15.3, -47.3)]
+    assert mapear_pivos(antigos, novos) == [0, None, None]
+
+
+def test_remapear_camada_leva_bits_e_sinais_para_a_nova_ordem():
+    # P0 coberto (-70 dBm), P1 avaliado e fora, P2 coberto (-85 dBm)
+    camada = _camada(cobertos=0b101, avaliados=0b111, sinais=[-70, SEM_SINAL, -85])
+    remapear_camada(camada, [2, 0, None, 1])
+
+    assert camada["avaliados"] == 0b1011
+    assert camada["cobertos"] == 0b0011
+    assert list(camada["sinais"]) == [-85, -70, SEM_SINAL, SEM_SINAL]
+
+
+def test_remapear_camada_nao_herda_pivo_nao_avaliado():
+    camada = _camada(cobertos=0b00, avaliados=0b01, sinais=[-60, SEM_SINAL])
+    remapear_camada(camada, [1, 0])
+
+    assert camada["avaliados"] == 0b10
+    assert camada["cobertos"] == 0
+    assert list(camada["sinais"]) == [SEM_SINAL, -60]
+
+
+def test_combinar_camadas_une_visiveis_e_escolhe_melhor_sinal():
+    # Brazil_V6 tem rxs = -90 dBm
+    camadas = [
+        _camada(cobertos=0b001, avaliados=0b111, sinais=[-80, -95, SEM_SINAL]),
+        _camada(cobertos=0b010, avaliados=0b111, sinais=[-85, -88, SEM_SINAL]),
+        _camada(cobertos=0b100, avaliados=0b111, sinais=[-50, -50, -50], visivel=False),
+    ]
+    cobertos, melhor_sinal = combinar_camadas(camadas, 3)
+
+    assert cobertos == 0b011
+    assert melhor_sinal == [(-80, 10), (-88, 2), None]
+
+
+def test_combinar_camadas_ignora_sinais_de_template_desconhecido():
+    camadas = [_camada(cobertos=0b1, avaliados=0b1, sinais=[-70], template="nao_existe")]
+    cobertos, melhor_sinal = combinar_camadas(camadas, 1)
+
+    assert cobertos == 0b1
+    assert melhor_sinal == [None]
@@ -0,0 +1,22 @@
+from services.geometria import codificar_polyline, compactar_ciclos
+
+
+def test_codificar_polyline_exemplo_do_google():
+    # Exemplo da documentação do formato "Encoded Polyline"
+    coords = [[38.5, -120.2], [40.7, -120.95], [43.252, -126.453]]
+    assert codificar_polyline(coords) == "_p~iF~ps|U_ulLnnqC_mqNvxq`@"
+
+
+def test_codificar_polyline_lista_vazia():
+    assert codificar_polyline([]) == ""
+
+
+def test_codificar_polyline_precisao_6():
+    # Mesmo ponto com um dígito a mais: os deltas ficam 10x maiores
+    assert codificar_polyline([[38.5, -120.2]], precisao=6) != codificar_polyline([[38.5, -120.2]])
+    assert codificar_polyline([[0.000001, 0]], precisao=6) == "A?"
+
+
+def test_compactar_ciclos_em_polyline_troca_coordenadas():
+    ciclos = [{"nome": "C1", "coordenadas": [[38.5, -120.2], [40.7, -120.95], [43.252, -126.453]]}]
+    assert compactar_ciclos(ciclos, formato="polyline") == [{"nome": "C1", "polyline": "_p~iF~ps|U_ulLnnqC_mqNvxq`@"}]
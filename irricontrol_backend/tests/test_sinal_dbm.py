@@ -0,0 +1,43 @@
+import numpy as np
+from PIL import Image
+
+from services.sinal_dbm import SEM_SINAL, amostrar_pivos, decodificar_imagem, obter_grade
+
+PALETA = {(0, 255, 51): -70, (10, 215, 86): -80, (18, 177, 104): -90}
+
+
+def _salvar_png(tmp_path, pixels):
+    caminho = str(tmp_path / "sinal.png")
+    Image.fromarray(np.array(pixels, dtype=np.uint8), "RGBA").save(caminho)
+    return caminho
+
+
+def test_decodificar_imagem_paleta_antialias_e_transparencia(tmp_path):
+    caminho = _salvar_png(tmp_path, [
+        [(0, 255, 51, 255), (10, 215, 86, 255), (18, 177, 104, 255)],
+        # Bordas suavizadas caem na cor mais próxima; transparente vira SEM_SINAL mesmo com RGB de paleta
+        [(3, 250, 55, 128), (16, 180, 100, 200), (0, 255, 51, 0)],
+    ])
+    grade = decodificar_imagem(caminho, PALETA)
+
+    assert grade.dtype == np.int8
+    assert grade.tolist() == [[-70, -80, -90], [-70, -90, SEM_SINAL]]
+
+
+def test_amostrar_pivos_le_o_pixel_de_cada_pivo():
+    grade = np.array([[-70, -80], [SEM_SINAL, -90]], dtype=np.int8)
+    bounds = [0.0, 0.0, 2.0, 2.0]  # sul, oeste, norte, leste: cada pixel tem 1 grau
+    pivos = [
+        {"lat": 1.5, "lon": 0.5},   # linha 0, coluna 0
+        {"lat": 1.5, "lon": 1.5},   # linha 0, coluna 1
+        {"lat": 0.5, "lon": 0.5},   # transparente
+        {"lat": 0.5, "lon": 1.5},   # linha 1, coluna 1
+        {"lat": 5.0, "lon": 5.0},   # fora da imagem
+    ]
+    assert amostrar_pivos(bounds, pivos, grade) == [-70, -80, None, -90, None]
+
+
+def test_obter_grade_devolve_none_para_imagem_ilegivel(tmp_path):
+    caminho = tmp_path / "sinal.png"
+    caminho.write_bytes(b"isto nao e um png")
+    assert obter_grade(str(caminho), "IRRICONTRO.dBm") is None
@@ -6,10 +6,32 @@ function formatCoordForFilename(coord) { // Renomeado para clareza
   return coord.toFixed(6).replace('.', '_').replace('-', 'm');
 }
 
+// Decodifica uma "Encoded Polyline" (precisão 5) em [[lat, lon], ...]
+function decodificarPolyline(polyline, precisao = 5) {
+  const fator = Math.pow(10, precisao);
+  const coords = [];
+  let indice = 0, lat = 0, lon = 0;
+  while (indice < polyline.length) {
+    for (const eixo of [0, 1]) {
+      let resultado = 0, deslocamento = 0, byte;
+      do {
+        byte = polyline.charCodeAt(indice++) - 63;
+        resultado |= (byte & 0x1f) << deslocamento;
+        deslocamento += 5;
+      } while (byte >= 0x20);
+      const delta = (resultado & 1) ? ~(resultado >> 1) : (resultado >> 1);
+      if (eixo === 0) lat += delta; else lon += delta;
+    }
+    coords.push([lat / fator, lon / fator]);
+  }
+  return coords;
+}
+
 async function processKmzFile(formData) {
   mostrarLoader(true);
   try {
-    const res = await fetch(`${API_BASE_URL}/kmz/processar_kmz`, { method: "POST", body: formData }); // ✅ CORRIGIDO
+    // Círculos simplificados (1 m) e em polyline: resposta bem menor em fazendas grandes
+    const res = await fetch(`${API_BASE_URL}/kmz/processar_kmz?formato=polyline&tolerancia_m=1`, { method: "POST", body: formData });
     if (!res.ok) {
         const errorData = await res.json().catch(() => ({ erro: `Erro HTTP ${res.status} ao processar KMZ` }));
         throw new Error(errorData.erro || `Erro HTTP ${res.status} ao processar KMZ`);
@@ -20,13 +42,18 @@ async function processKmzFile(formData) {
     resetMap(); // Limpa mapa antes de carregar novo
     resetUI();  // Limpa UI
 
+    estudoId = data.estudo_id ?? null;
+    camadasNoServidor = new Set();
+    pivosEnviados = null;
     antenaGlobal = data.antena;
     antenaGlobal.altura_receiver = antenaGlobal.altura_receiver || 3; // Garante valor padrão
 
     addAntenaMarker(antenaGlobal);
     addPivoMarkers(data.pivos.map(p => ({...p, fora: true}))); // Marca como fora inicialmente
     addBombaMarkers(data.bombas || []);
-    if (data.ciclos) addCirculosKMZ(data.ciclos);
+    if (data.ciclos) {
+      addCirculosKMZ(data.ciclos.map(c => c.polyline != null ? { nome: c.nome, coordenadas: decodificarPolyline(c.polyline) } : c));
+    }
 
     // Garante que antenaGlobal e data.pivos são válidos antes de tentar fitBounds
     if (antenaGlobal && antenaGlobal.lat != null && antenaGlobal.lon != null && data.pivos && data.pivos.length > 0) {
@@ -71,7 +98,8 @@ async function simulateMainSignal() {
     altura_receiver: antenaGlobal.altura_receiver,
     nome: antenaGlobal.nome,
     pivos_atuais: pivosParaSimulacao,
-    template: templateSelecionado
+    template: templateSelecionado,
+    estudo_id: estudoId
   };
   console.log("Payload para /simulation/simular_sinal:", JSON.stringify(payload, null, 2));
 
@@ -89,6 +117,7 @@ async function simulateMainSignal() {
 
     if (data.imagem_salva && data.bounds) {
       clearAllOverlays();
+      camadasNoServidor = new Set(); // Nova simulação principal descarta as camadas do estudo no backend
       antenaGlobal.overlay = addImageOverlay(data.imagem_salva, data.bounds);
 
       map.fitBounds(L.latLngBounds([[data.bounds[0], data.bounds[1]], [data.bounds[2], data.bounds[3]]]));
@@ -125,7 +154,8 @@ async function simulateRepeaterSignal(lat, lon, alturaAntena, alturaReceiver) {
         altura: alturaAntena,
         altura_receiver: alturaReceiver,
         pivos_atuais: pivosParaSimulacao,
-        template: templateSelecionado
+        template: templateSelecionado,
+        estudo_id: estudoId
     };
     console.log("Payload para /simulation/simular_manual (repetidora):", JSON.stringify(payload, null, 2));
 
@@ -171,7 +201,13 @@ async function simulateRepeaterSignal(lat, lon, alturaAntena, alturaReceiver) {
     }
 }
 
-async function reavaliarPivosViaAPI() {
+function nomeImagemOverlay(overlay) {
+    return overlay._url.split('?')[0].split('/').pop();
+}
+
+// Envia só o que mudou desde a última chamada (overlays exibidos/ocultos/removidos e,
+// se editados, os pivôs); o backend mantém a cobertura de cada overlay por estudo.
+async function reavaliarPivosViaAPI({ remover = [] } = {}) {
     if (Object.keys(pivotsMap).length === 0) return;
 
     const pivosParaReavaliacao = Object.entries(pivotsMap).map(([nome, marcador]) => {
@@ -179,34 +215,32 @@ async function reavaliarPivosViaAPI() {
         return { nome, lat, lon: lng };
     });
 
-    const activeOverlaysData = [];
+    const imagensAtivas = new Set();
     if (antenaGlobal?.overlay && map.hasLayer(antenaGlobal.overlay)) {
-        const b = antenaGlobal.overlay.getBounds();
-        activeOverlaysData.push({
-            imagem: antenaGlobal.overlay._url.split('?')[0],
-            bounds: [b.getSouth(), b.getWest(), b.getNorth(), b.getEast()]
-        });
+        imagensAtivas.add(nomeImagemOverlay(antenaGlobal.overlay));
     }
     overlaysVisiveis.forEach(overlay => {
-        if (map.hasLayer(overlay)) {
-            const b = overlay.getBounds();
-            activeOverlaysData.push({
-                imagem: overlay._url.split('?')[0],
-                bounds: [b.getSouth(), b.getWest(), b.getNorth(), b.getEast()]
-            });
-        }
+        if (map.hasLayer(overlay)) imagensAtivas.add(nomeImagemOverlay(overlay));
     });
 
-    if (activeOverlaysData.length === 0) {
-    updatePivosStatus(pivosParaReavaliacao.map(p => ({ ...p, fora: true })));
-    return;
-}
+    if (imagensAtivas.size === 0 && remover.length === 0) {
+        updatePivosStatus(pivosParaReavaliacao.map(p => ({ ...p, fora: true })));
+        return;
+    }
 
+    const assinaturaPivos = JSON.stringify(pivosParaReavaliacao);
+    const payload = {
+        estudo_id: estudoId,
+        adicionar: [...imagensAtivas].filter(nome => !camadasNoServidor.has(nome)),
+        ocultar: [...camadasNoServidor].filter(nome => !imagensAtivas.has(nome) && !remover.includes(nome)),
+        remover
+    };
+    if (assinaturaPivos !== pivosEnviados) payload.pivos = pivosParaReavaliacao;
 
     try {
-        const res = await fetch(`${API_BASE_URL}/simulation/reavaliar_pivos`, { // ✅ CORRIGIDO
+        const res = await fetch(`${API_BASE_URL}/simulation/atualizar_cobertura`, {
             method: "POST", headers: { "Content-Type": "application/json" },
-            body: JSON.stringify({ pivos: pivosParaReavaliacao, overlays: activeOverlaysData })
+            body: JSON.stringify(payload)
         });
         if (!res.ok) {
              const errorData = await res.json().catch(() => ({ erro: `Erro HTTP ${res.status} ao reavaliar pivôs` }));
@@ -215,6 +249,8 @@ async function reavaliarPivosViaAPI() {
         const data = await res.json();
         if (data.erro) throw new Error(data.erro);
 
+        camadasNoServidor = new Set(data.camadas_visiveis || []);
+        pivosEnviados = assinaturaPivos;
         if (data.pivos) {
             updatePivosStatus(data.pivos);
         }
@@ -291,19 +327,22 @@ function downloadKmz() {
     }
 
     let nomeImagemPrincipal = "";
-    let nomeBoundsPrincipal = "";
 
     if (antenaGlobal.overlay && antenaGlobal.overlay._url) {
         const urlParts = antenaGlobal.overlay._url.split('?')[0].split('/');
         nomeImagemPrincipal = urlParts[urlParts.length - 1];
-        nomeBoundsPrincipal = nomeImagemPrincipal.replace(".png", ".json");
     } else {
         mostrarMensagem("⚠️ Imagem da antena principal não encontrada. O KMZ pode não incluir a cobertura principal.", "info");
     }
 
     const params = new URLSearchParams();
+    if (estudoId != null) params.append("estudo_id", estudoId);
     if (nomeImagemPrincipal) params.append("imagem", nomeImagemPrincipal);
-    if (nomeBoundsPrincipal) params.append("bounds_file", nomeBoundsPrincipal);
+    // Envia só as repetidoras ainda no mapa; sem nenhuma, manda "" para o backend não incluir as removidas
+    if (repetidoras.length === 0) params.append("repetidoras", "");
+    repetidoras.forEach(r => {
+        if (r.overlay && r.overlay._url) params.append("repetidoras", r.overlay._url.split('?')[0].split('/').pop());
+    });
 
     const url = `${API_BASE_URL}/kmz/exportar_kmz?${params.toString()}`; // ✅ CORRIGIDO
     window.open(url, '_blank');
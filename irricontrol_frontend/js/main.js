@@ -14,6 +14,9 @@ let map;
 let visadaLayerGroup; // Grupo para linhas e marcadores de diagnóstico de visada
 let overlaysVisiveis = []; // Armazena ImageOverlays ativos para controle de opacidade e reavaliação
 let antenaGlobal = null;   // Objeto com dados da antena principal {lat, lon, altura, nome, overlay, label, etc.}
+let estudoId = null;       // ID do estudo no backend (retornado por /kmz/processar_kmz)
+let camadasNoServidor = new Set(); // Imagens visíveis no estado de cobertura do backend
+let pivosEnviados = null;  // Última lista de pivôs enviada para /simulation/atualizar_cobertura (JSON)
 let pivotsMap = {};       // Objeto para mapear nome_pivo -> L.CircleMarker
 let repetidoras = [];       // Array de objetos de repetidoras {id, marker, overlay, label, altura, altura_receiver}
 let posicoesEditadas = {}; // { nomePivo: L.latLng } - Armazena posições alteradas no modo de edição
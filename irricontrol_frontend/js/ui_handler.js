@@ -134,7 +134,7 @@ function adicionarRepetidoraNoPainel(repetidora) {
         idsDisponiveis.sort((a, b) => a - b);
         repetidoras = repetidoras.filter(r => r.id !== repetidora.id);
 
-        reavaliarPivosViaAPI();
+        reavaliarPivosViaAPI({ remover: repetidora.overlay ? [nomeImagemOverlay(repetidora.overlay)] : [] });
         atualizarPainelInfoRepetidoras();
     });
 